@@ -0,0 +1,143 @@
+#ifndef __BINARY_OUTPUT_HPP
+#define __BINARY_OUTPUT_HPP
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <cstring>
+#include <ostream>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+/**
+ * Fixed-size header preceding each frame in --binary output mode.
+ *
+ * A frame is the header followed by num_faces * values_per_face packed
+ * native-endian float32 values. The layout must match FRAME_HEADER in
+ * src/tracker_output.py.
+ */
+struct FrameHeader {
+    char magic[4];              // always "GZRF"
+    uint32_t num_faces;
+    uint32_t values_per_face;
+    uint32_t reserved;
+    uint64_t frame_id;
+    double timestamp;           // capture time, in seconds since the epoch
+};
+
+static_assert(sizeof(FrameHeader) == 32, "FrameHeader must be packed into 32 bytes");
+
+inline double capture_timestamp() {
+    using namespace std::chrono;
+    return duration_cast<duration<double>>(system_clock::now().time_since_epoch()).count();
+}
+
+inline void write_binary_frame(std::ostream& out, uint64_t frame_id, double timestamp,
+                               uint32_t num_faces, uint32_t values_per_face,
+                               const std::vector<float>& values) {
+    FrameHeader header;
+    std::memcpy(header.magic, "GZRF", 4);
+    header.num_faces = num_faces;
+    header.values_per_face = values_per_face;
+    header.reserved = 0;
+    header.frame_id = frame_id;
+    header.timestamp = timestamp;
+
+    out.write(reinterpret_cast<const char*>(&header), sizeof(header));
+    out.write(reinterpret_cast<const char*>(values.data()), values.size() * sizeof(float));
+    out.flush();
+}
+
+/**
+ * Shared-memory ring of binary frames, written with --shm instead of stdout.
+ *
+ * The layout must match src/shared_frames.py: a 64-byte RingHeader, then
+ * num_slots slots of slot_size bytes, each holding a sequence number (odd
+ * while the slot is being written), a FrameHeader and the packed values.
+ */
+struct RingHeader {
+    char magic[4];              // always "GZRR"
+    uint32_t num_slots;
+    uint32_t slot_size;
+    uint32_t reserved;
+    uint64_t num_written;       // number of completed frames
+    char padding[40];
+};
+
+static_assert(sizeof(RingHeader) == 64, "RingHeader must be packed into 64 bytes");
+
+class SharedFrameRing {
+public:
+    SharedFrameRing(const std::string& path, uint32_t capacity, uint32_t num_slots = 8)
+        : num_slots(num_slots), capacity(capacity) {
+        slot_size = (sizeof(uint64_t) + sizeof(FrameHeader) + capacity * sizeof(float) + 7) / 8 * 8;
+        size = sizeof(RingHeader) + num_slots * slot_size;
+
+        unlink(path.c_str());
+        int fd = open(path.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0600);
+        if (fd < 0 || ftruncate(fd, size) != 0) {
+            throw std::runtime_error("Couldn't create shared-memory ring " + path);
+        }
+        void* mapped = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        close(fd);
+        if (mapped == MAP_FAILED) {
+            throw std::runtime_error("Couldn't map shared-memory ring " + path);
+        }
+        data = static_cast<char*>(mapped);
+
+        header()->num_slots = num_slots;
+        header()->slot_size = slot_size;
+        header()->reserved = 0;
+        header()->num_written = 0;
+        std::atomic_thread_fence(std::memory_order_release);
+        std::memcpy(header()->magic, "GZRR", 4);
+    }
+
+    ~SharedFrameRing() {
+        munmap(data, size);
+    }
+
+    /** Writes a frame into the oldest slot, dropping faces beyond the ring's capacity. */
+    void write(uint64_t frame_id, double timestamp, uint32_t num_faces, uint32_t values_per_face,
+               const std::vector<float>& values) {
+        if (values_per_face > 0 && num_faces * values_per_face > capacity) {
+            num_faces = capacity / values_per_face;
+        }
+
+        char* slot = data + sizeof(RingHeader) + (header()->num_written % num_slots) * slot_size;
+        auto sequence = reinterpret_cast<uint64_t*>(slot);
+        auto frame_header = reinterpret_cast<FrameHeader*>(slot + sizeof(uint64_t));
+
+        *sequence += 1;
+        std::atomic_thread_fence(std::memory_order_release);
+        std::memcpy(frame_header->magic, "GZRF", 4);
+        frame_header->num_faces = num_faces;
+        frame_header->values_per_face = values_per_face;
+        frame_header->reserved = 0;
+        frame_header->frame_id = frame_id;
+        frame_header->timestamp = timestamp;
+        std::memcpy(frame_header + 1, values.data(), num_faces * values_per_face * sizeof(float));
+        std::atomic_thread_fence(std::memory_order_release);
+        *sequence += 1;
+        std::atomic_thread_fence(std::memory_order_release);
+        header()->num_written += 1;
+    }
+
+private:
+    RingHeader* header() {
+        return reinterpret_cast<RingHeader*>(data);
+    }
+
+    char* data;
+    size_t size;
+    uint32_t num_slots;
+    uint32_t slot_size;
+    uint32_t capacity;
+};
+
+#endif
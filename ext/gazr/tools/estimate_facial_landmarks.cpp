@@ -2,11 +2,14 @@
 
 #include <iostream>
 #include <iomanip>
+#include <memory>
 
 #include <boost/program_options.hpp>
 
 #include "LinearMath/Matrix3x3.h"
 
+#include "binary_output.hpp"
+
 #include "../src/facial_landmark_estimation.hpp"
 
 #define STR_EXPAND(tok) #tok
@@ -39,6 +42,7 @@ int main(int argc, char **argv)
 
     bool show_frame = false;
     bool use_camera = false;
+    bool binary_output = false;
 
     po::positional_options_description p;
     p.add("image", 1);
@@ -51,6 +55,8 @@ int main(int argc, char **argv)
             ("model", po::value<string>(), "dlib's trained face model")
             ("image", po::value<string>(), "image to process (png, jpg)")
             ("camera", po::value<int>()->default_value(0), "index of the webcam to use")
+            ("binary", "write frames in the packed binary format instead of text")
+            ("shm", po::value<string>(), "write binary frames into a shared-memory ring at this path instead of stdout")
             ;
 
     po::variables_map vm;
@@ -74,6 +80,10 @@ int main(int argc, char **argv)
         show_frame = true;
     }
 
+    if (vm.count("binary")) {
+        binary_output = true;
+    }
+
     if (vm.count("model") == 0) {
         cout << "You must specify the path to a trained dlib's face model\n"
              << "with the option --model." << endl;
@@ -118,11 +128,21 @@ int main(int argc, char **argv)
         estimator.focalLength = 85.0 / 22.3 * frame.size().width;
     }
 
+    unique_ptr<SharedFrameRing> ring;
+    if (vm.count("shm")) {
+        ring.reset(new SharedFrameRing(vm["shm"].as<string>(), 8 * 2 * 68));
+        binary_output = true;
+    }
+
+    uint64_t frame_id = 0;
+    vector<float> values;
+
     while(true) {
         if(use_camera) {
             auto ok = video_in.read(frame);
             if (!ok) break;
         }
+        auto timestamp = capture_timestamp();
 
 
         estimator.update(frame);
@@ -130,21 +150,35 @@ int main(int argc, char **argv)
 
         auto all_landmarks = estimator.all_landmarks();
 
-        int i = 0;
-        cout << "{";
-
-        for(auto landmarks : all_landmarks) {
-            cout << "\"face_" << i << "\": [";
-            cout << setprecision(4) << fixed;
-            for (unsigned long j = 0; j < landmarks.size(); ++j) {
-                if (j > 0) cout << ", ";
-                cout << "[" << landmarks[j].x << ", " << landmarks[j].y << "]";
+        if (binary_output) {
+            uint32_t values_per_face = all_landmarks.empty() ? 0 : 2 * all_landmarks[0].size();
+            values.clear();
+            for(auto landmarks : all_landmarks) {
+                for (unsigned long j = 0; j < landmarks.size(); ++j) {
+                    values.push_back(landmarks[j].x);
+                    values.push_back(landmarks[j].y);
+                }
             }
-            cout << "],";
-
-            i++;
+            if (ring) ring->write(frame_id++, timestamp, all_landmarks.size(), values_per_face, values);
+            else write_binary_frame(cout, frame_id++, timestamp, all_landmarks.size(), values_per_face, values);
+        }
+        else {
+            int i = 0;
+            cout << "{";
+
+            for(auto landmarks : all_landmarks) {
+                cout << "\"face_" << i << "\": [";
+                cout << setprecision(4) << fixed;
+                for (unsigned long j = 0; j < landmarks.size(); ++j) {
+                    if (j > 0) cout << ", ";
+                    cout << "[" << landmarks[j].x << ", " << landmarks[j].y << "]";
+                }
+                cout << "],";
+
+                i++;
+            }
+            cout << "}\n" << flush;
         }
-        cout << "}\n" << flush;
 
         if (show_frame) {
             Mat flipped = estimator._debug.clone();
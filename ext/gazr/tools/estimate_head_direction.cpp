@@ -2,11 +2,14 @@
 
 #include <iostream>
 #include <iomanip>
+#include <memory>
 
 #include <boost/program_options.hpp>
 
 #include "LinearMath/Matrix3x3.h"
 
+#include "binary_output.hpp"
+
 #include "../src/head_pose_estimation.hpp"
 
 #define STR_EXPAND(tok) #tok
@@ -43,6 +46,7 @@ int main(int argc, char **argv)
 
     bool show_frame = false;
     bool use_camera = false;
+    bool binary_output = false;
 
     po::positional_options_description p;
     p.add("image", 1);
@@ -55,6 +59,8 @@ int main(int argc, char **argv)
             ("model", po::value<string>(), "dlib's trained face model")
             ("image", po::value<string>(), "image to process (png, jpg)")
             ("camera", po::value<int>()->default_value(0), "index of the webcam to use")
+            ("binary", "write frames in the packed binary format instead of text")
+            ("shm", po::value<string>(), "write binary frames into a shared-memory ring at this path instead of stdout")
             ;
 
     po::variables_map vm;
@@ -78,6 +84,10 @@ int main(int argc, char **argv)
         show_frame = true;
     }
 
+    if (vm.count("binary")) {
+        binary_output = true;
+    }
+
     if (vm.count("model") == 0) {
         cout << "You must specify the path to a trained dlib's face model\n"
              << "with the option --model." << endl;
@@ -124,11 +134,21 @@ int main(int argc, char **argv)
         estimator.focalLength = 85.0 / 22.3 * frame.size().width;
     }
 
+    unique_ptr<SharedFrameRing> ring;
+    if (vm.count("shm")) {
+        ring.reset(new SharedFrameRing(vm["shm"].as<string>(), 8 * 6));
+        binary_output = true;
+    }
+
+    uint64_t frame_id = 0;
+    vector<float> values;
+
     while(true) {
         if(use_camera) {
             auto ok = video_in.read(frame);
             if (!ok) break;
         }
+        auto timestamp = capture_timestamp();
 
 
         estimator.update(frame);
@@ -137,7 +157,8 @@ int main(int argc, char **argv)
         auto poses = estimator.poses();
 
         int i = 0;
-        cout << "{";
+        if (!binary_output) cout << "{";
+        values.clear();
 
         for(auto pose : poses) {
 
@@ -161,13 +182,26 @@ int main(int argc, char **argv)
             yaw = raw_yaw;
             pitch = -raw_roll;
 
-            cout << "\"face_" << i << "\":";
-            cout << setprecision(1) << fixed << "{\"yaw\":" << todeg(yaw) << ", \"pitch\":" << todeg(pitch) << ", \"roll\":" << todeg(roll) << ",";
-            cout << setprecision(4) << fixed << "\"x\":" << pose(0,3) << ", \"y\":" << pose(1,3) << ", \"z\":" << pose(2,3) << "},";
+            if (binary_output) {
+                float face_values[] = {(float) todeg(yaw), (float) todeg(pitch), (float) todeg(roll),
+                                       (float) pose(0,3), (float) pose(1,3), (float) pose(2,3)};
+                values.insert(values.end(), face_values, face_values + 6);
+            }
+            else {
+                cout << "\"face_" << i << "\":";
+                cout << setprecision(1) << fixed << "{\"yaw\":" << todeg(yaw) << ", \"pitch\":" << todeg(pitch) << ", \"roll\":" << todeg(roll) << ",";
+                cout << setprecision(4) << fixed << "\"x\":" << pose(0,3) << ", \"y\":" << pose(1,3) << ", \"z\":" << pose(2,3) << "},";
+            }
 
             i++;
         }
-        cout << "}\n" << flush;
+        if (binary_output) {
+            if (ring) ring->write(frame_id++, timestamp, poses.size(), 6, values);
+            else write_binary_frame(cout, frame_id++, timestamp, poses.size(), 6, values);
+        }
+        else {
+            cout << "}\n" << flush;
+        }
 
         if (show_frame) {
             Mat flipped = estimator._debug.clone();
@@ -7,9 +7,11 @@ from utilities import profiling
 from utilities import signal_processing
 import facial_landmarks
 import head_pose
+import solver_process
 import stereo_cameras
 import transform_util
 import stereo_util
+import stereo_sync
 import visuals.text
 
 _HEAD_POSE_POSTPROCESSORS = {
@@ -231,28 +233,31 @@ class ScreenStabilizer(CalibratedAnimator):
 # STEREO ANIMATION
 
 def make_facial_calibration_filters():
-    return [[signal_processing.SlidingWindowFilter(20, estimation_mode='mean')
-             for j in range(2)] for i in range(facial_landmarks.NUM_KEYPOINTS)]
+    return facial_landmarks.make_calibration_filters()
 
 def make_facial_raw_filters():
-    return [[signal_processing.SlidingWindowFilter(2, estimation_mode='raw')
-             for j in range(2)] for i in range(facial_landmarks.NUM_KEYPOINTS)]
+    return signal_processing.FilterBank((facial_landmarks.NUM_KEYPOINTS, 2), 2, estimation_mode='raw')
 
 class FacialLandmarkAnimator(AsynchronousAnimator):
     """Asynchronously updates a rendering pipeline with facial landmarks."""
-    def __init__(self, left_filters, right_filters):
+    def __init__(self, left_filters, right_filters, max_skew=stereo_sync.DEFAULT_MAX_SKEW,
+                 recorder=None, replay_path=None, replay_speed=1.0):
+        """
+        Arguments:
+            recorder: if provided, a sessions.SessionRecorder which both trackers record into.
+            replay_path: if provided, the path of a session file which both trackers' frames
+                are played back from, instead of starting the trackers.
+            replay_speed: the speed of playback relative to real time, or None for as fast as
+                possible.
+        """
         super(FacialLandmarkAnimator, self).__init__('FacialLandmarkAnimator')
         self._pipeline = None
         self._visual_node = None
 
-        self._tracker_left = facial_landmarks.FacialLandmarks(
-            camera_index=0, filters=left_filters)
-        self._tracker_right = facial_landmarks.FacialLandmarks(
-            camera_index=1, filters=right_filters)
-        self._left_keypoints = None
-        self._left_keypoints_updated = False
-        self._right_keypoints = None
-        self._right_keypoints_updated = False
+        self._trackers = facial_landmarks.StereoFacialLandmarks(
+            left_filters, right_filters, max_skew, replay_path, replay_speed, recorder=recorder)
+        self.synchronizer = self._trackers.synchronizer
+        self.pair_timestamp = None
         self.framerate_counter = profiling.FramerateCounter()
 
     def register_rendering_pipeline(self, pipeline):
@@ -265,37 +270,29 @@ class FacialLandmarkAnimator(AsynchronousAnimator):
         self._visual_node = visual_node
 
     def animate_sync(self, callback=None):
-        self._tracker_left.monitor_async(self._update_left_keypoints)
-        self._tracker_right.monitor_async(self._update_right_keypoints)
+        self._trackers.run_async()
         super(FacialLandmarkAnimator, self).animate_sync(callback)
 
-    def _update_left_keypoints(self, parameters):
-        self._left_keypoints = parameters
-        self._left_keypoints_updated = True
-
-    def _update_right_keypoints(self, parameters):
-        self._right_keypoints = parameters
-        self._right_keypoints_updated = True
-
     def stop_animating(self):
         """Stops updating a RenderingPipeline.
 
         Threading:
-            Joins a head pose tracking thread.
+            Joins the thread monitoring both trackers.
         """
-        self._tracker_left.stop_monitoring()
-        self._tracker_right.stop_monitoring()
+        self._trackers.stop()
         super(FacialLandmarkAnimator, self).stop_animating()
 
     def execute(self, callback=None):
-        if self._left_keypoints_updated and self._right_keypoints_updated:
-            keypoints = np.stack([self._left_keypoints, self._right_keypoints], axis=1)
-            if callback is None:
-                self.on_update(keypoints)
-            else:
-                callback(keypoints)
-            self._left_keypoints_updated = False
-            self._right_keypoints_updated = False
+        """Waits for the next pair of keypoints and handles it. The capture time of the pair
+        is available in pair_timestamp while it is handled."""
+        pair = self._trackers.get_pair()
+        if pair is None:
+            return
+        (keypoints, self.pair_timestamp) = pair
+        if callback is None:
+            self.on_update(keypoints)
+        else:
+            callback(keypoints)
 
     def on_update(self, keypoints):
         pass
@@ -322,36 +319,41 @@ class FaceAxesAnimator(FacialLandmarkAnimator):
         self._pipeline.update()
 
 class FacePointsAnimator(FacialLandmarkAnimator):
-    def __init__(self, *args, **kwargs):
-        super(FacePointsAnimator, self).__init__(*args, **kwargs)
+    def __init__(self, left_filters, right_filters, triangulation_mode='svd', **kwargs):
+        super(FacePointsAnimator, self).__init__(left_filters, right_filters, **kwargs)
         self._camera_matrices = stereo_util.make_parallel_camera_matrices(
             stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT, -stereo_cameras.TRANSLATION[0])
+        self.triangulation_mode = triangulation_mode
 
 
     def register_rendering_pipeline(self, pipeline):
         super(FacePointsAnimator, self).register_rendering_pipeline(pipeline)
 
     def on_update(self, keypoints):
-        face = stereo_util.compute_3d_model(keypoints, self._camera_matrices)
+        face = stereo_util.compute_3d_model(keypoints, self._camera_matrices,
+                                            mode=self.triangulation_mode)
         face[:,1] *= -1
         self._visual_node.update_list_data(face)
         self.framerate_counter.tick()
         self._pipeline.update()
 
 class CalibratedFaceAnimator(CalibratedAnimator):
-    def __init__(self):
+    def __init__(self, cursor=None, **tracker_options):
+        """
+        Arguments:
+            cursor: the solver_process.GazeCursor which keeps the calibration.
+            tracker_options: options for the FacialLandmarkAnimators of each phase, such as
+                recorder or replay_path.
+        """
         super(CalibratedFaceAnimator, self).__init__()
-        self.calibration = None
-        self._calibration = None
+        self.cursor = solver_process.GazeCursor() if cursor is None else cursor
+        self.tracker_options = tracker_options
         self.framerate_counter = None
         self._visual_node = None
-        self.points_3d_filters = [[signal_processing.SlidingWindowFilter(20, estimation_mode='mean')
-                                   for j in range(3)]for i in range(facial_landmarks.NUM_KEYPOINTS)]
-        self.target_filters = [signal_processing.SlidingWindowFilter(20, estimation_mode=('kernel', signal_processing.half_gaussian_window(20, 10.0)))
-                               for i in range(2)]
-        self.target_filters = [signal_processing.ThresholdKalmanFilter(position_from_stationary=10, velocity_from_stationary=100, acceleration_from_stationary=200,
-                                                                       velocity_to_stationary=200, acceleration_to_stationary=300)
-                               for i in range(2)]
+
+    @property
+    def calibration(self):
+        return self.cursor.calibration
 
     def register_rendering_pipeline(self, pipeline):
         super(CalibratedFaceAnimator, self).register_rendering_pipeline(pipeline)
@@ -361,8 +363,9 @@ class CalibratedFaceAnimator(CalibratedAnimator):
         self._visual_node = visual_node
 
     def on_start_calibrating(self):
+        self.cursor.start_calibrating()
         self._facial_landmarks = FacePointsAnimator(
-            make_facial_calibration_filters(), make_facial_calibration_filters())
+            make_facial_calibration_filters(), make_facial_calibration_filters(), **self.tracker_options)
         self.framerate_counter = self._facial_landmarks.framerate_counter
         self._facial_landmarks.register_rendering_pipeline(self._pipeline)
         self._facial_landmarks.register_visual_node(self._visual_node)
@@ -370,24 +373,19 @@ class CalibratedFaceAnimator(CalibratedAnimator):
 
     def on_start_responding(self):
         self._facial_landmarks.stop_animating()
-        self.calibration = stereo_util.StereoModelCalibration(
-            -stereo_cameras.TRANSLATION[0], stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT,
-            stereo_util.compute_3d_model(self._calibration, stereo_util.make_parallel_camera_matrices(
-                stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT, -stereo_cameras.TRANSLATION[0])),
-            #initial_pos=np.array([0, 0]))
-            initial_pos=np.array([-stereo_cameras.TRANSLATION[0] / 2.0,
-                                  transform_util.CAMERA_Y + transform_util.MONITOR_HEIGHT / 2.0]))
+        self.cursor.start_responding()
         self._facial_landmarks = FacePointsAnimator(
             #make_facial_raw_filters(), make_facial_raw_filters())
-            make_facial_calibration_filters(), make_facial_calibration_filters())
+            make_facial_calibration_filters(), make_facial_calibration_filters(), **self.tracker_options)
         self.framerate_counter = self._facial_landmarks.framerate_counter
         self._facial_landmarks.animate_async(self._update_head)
 
     def stop_animating(self):
         self._facial_landmarks.stop_animating()
+        self.cursor.stop()
 
     def _update_calibration(self, parameters):
-        self._calibration = parameters
+        self.cursor.update_calibration(parameters)
         self._facial_landmarks.on_update(parameters)
 
     def _update_head(self, parameters):
@@ -398,30 +396,33 @@ class CalibratedFaceAnimator(CalibratedAnimator):
         self._pipeline.update()
 
 class CalibratedCursorAnimator(CalibratedFaceAnimator):
-    def __init__(self):
-        super(CalibratedCursorAnimator, self).__init__()
+    def __init__(self, use_solver_process=False, gaze_options=solver_process.DEFAULT_GAZE_OPTIONS,
+                 **tracker_options):
+        """
+        Arguments:
+            use_solver_process: whether to solve for the gaze location in a worker process, so
+                that solving does not compete with the animator and render threads for the GIL.
+                Each update then shows the newest result available, which lags by about a frame.
+                The gaze is solved with the same gaze_options either way.
+            gaze_options: keyword arguments for StereoModelCalibration.compute_gaze_location,
+                e.g. solver_process.ORIGINAL_GAZE_OPTIONS for the original sequential RANSAC.
+            tracker_options: as for CalibratedFaceAnimator.
+        """
+        super(CalibratedCursorAnimator, self).__init__(
+            solver_process.GazeCursor(gaze_options, use_solver_process), **tracker_options)
+
+    def _update_target(self, result):
+        """Shows the cursor position of a solver_process.GazeResult. Returns the position in
+        pixels, if any."""
+        if result.target_px is None:
+            return None
+        target_px = np.array([np.append(result.target_px, 0.0)], dtype='f')
+        self._visual_node.update_list_data(target_px)
+        self.framerate_counter.tick()
+        self._pipeline.update()
+        return target_px
 
     def _update_head(self, parameters):
-        try:
-            points_3d = stereo_util.compute_3d_model(parameters, self.calibration._camera_matrices)
-            points_3d_filtered = np.empty_like(points_3d)
-            for i in range(facial_landmarks.NUM_KEYPOINTS):
-                for j in range(3):
-                    self.points_3d_filters[i][j].append(points_3d[i,j])
-                    points_3d_filtered[i,j] = self.points_3d_filters[i][j].estimate_current()
-            target = self.calibration.compute_gaze_location(points_3d=points_3d_filtered, use_ransac=True,
-                                                            threshold=2, num_iter=50)
-            target_px = transform_util.screen_xy_to_render_xy(*target)
-            target_px = -2 * np.array([target_px[0], target_px[1]])
-            for i in range(2):
-                self.target_filters[i].append(target_px[i])
-            target_px = np.array([[self.target_filters[0].estimate_current(),
-                                   self.target_filters[1].estimate_current(), 0.0]],
-                                 dtype='f')
-            if not np.any(np.isnan(target_px)):
-                self._visual_node.update_list_data(target_px)
-                self.framerate_counter.tick()
-                self._pipeline.update()
-        except stereo_util.NoIntersectionException:
-            pass
-
+        result = self.cursor.update(parameters, self._facial_landmarks.pair_timestamp)
+        if result is not None:
+            self._update_target(result)
@@ -0,0 +1,423 @@
+#!/usr/bin/env python2
+"""Benchmarks of the tracking hot paths.
+
+Each benchmark times individual calls of one hot path on synthetic stereo landmarks, and
+reports the percentiles of the per-call latencies and the throughput, as medians over a few
+interleaved repeats. Results can be saved as JSON and compared against the results of an
+earlier run. By default, results are compared against the baseline stored in
+benchmark_baseline.json, and slowdowns beyond the tolerance are reported:
+
+    python benchmark.py
+    python benchmark.py --fail-on-regression  # exit with status 1 on a regression
+    python benchmark.py --baseline ''  # no comparison
+
+The stored baseline was measured on one machine, so the comparison is only meaningful on that
+machine, and even there the fastest benchmarks can be flagged by noise alone. On another machine, or after an
+intended change in performance, refresh it with
+
+    python benchmark.py --output benchmark_baseline.json
+
+and commit it along with the change.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import timeit
+import functools
+import argparse
+import platform
+import itertools
+import collections
+
+import numpy as np
+
+from utilities import signal_processing
+import facial_landmarks
+import head_pose
+import stereo_util
+import solver_process
+import synthetic
+import tracker_output
+import transform_util
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_ITERATIONS = 1000
+DEFAULT_MAX_TIME = 1.0  # s per benchmark and repeat
+DEFAULT_WARMUP = 20
+DEFAULT_REPEATS = 3
+DEFAULT_METRIC = 'p50'
+# Between runs of the same code on one machine, the medians of 3 repeats varied by up to 1.25x for
+# the benchmarks over 100 us, but the ones around 10 us jumped between two levels up to 1.8x apart
+DEFAULT_TOLERANCE = 0.5
+NUM_FRAMES = 200
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+BENCHMARKS = collections.OrderedDict()
+
+def benchmark(name):
+    """Registers a benchmark setup function under name.
+    The setup function takes a Fixtures and returns a function which makes one call of the
+    hot path, or None if the benchmark cannot run in this environment."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def _cycle(items):
+    """Returns a function which returns the next of items on each call, wrapping around."""
+    return functools.partial(next, itertools.cycle(items))
+
+class Fixtures(object):
+    """Synthetic inputs shared by the benchmarks."""
+    def __init__(self, num_frames=NUM_FRAMES, seed=0):
+        source = synthetic.SyntheticStereoSource('wander', noise=0.5, outlier_rate=0.05, seed=seed)
+        self.frames = list(source.generate(num_frames))
+        self.keypoints = [frame.keypoints for frame in self.frames]
+        self.landmarks_lines = [synthetic.format_landmarks_line(frame, 0) for frame in self.frames]
+        self.landmarks_frames = [tracker_output.Frame(frame.frame_id, frame.timestamp,
+                                                      frame.keypoints[:, 0].reshape(1, -1).astype(np.float32))
+                                 for frame in self.frames]
+        self.poses = [dict(zip(('x', 'y', 'z', 'yaw', 'pitch', 'roll'),
+                               source.trajectory.get_parameters(frame.timestamp)))
+                      for frame in self.frames]
+        self.pose_lines = [('{{"face_0":{{"yaw":{yaw:.4f}, "pitch":{pitch:.4f}, "roll":{roll:.4f},'
+                            '"x":{x:.4f}, "y":{y:.4f}, "z":{z:.4f}}},}}\n').format(**pose)
+                           for pose in self.poses]
+        self._calibration = None
+
+    def make_calibration(self, **kwargs):
+        """Returns a calibration with the first frame as the calibration keypoints."""
+        return solver_process.make_calibration(self.keypoints[0], **kwargs)
+
+    @property
+    def calibration(self):
+        if self._calibration is None:
+            self._calibration = self.make_calibration()
+        return self._calibration
+
+# Monitor parsing
+
+@benchmark('monitor.update.landmarks_text')
+def _monitor_update_landmarks(fixtures):
+    monitor = facial_landmarks.FacialLandmarks(filters=copy.deepcopy(facial_landmarks.DEFAULT_FILTERS))
+    next_line = _cycle(fixtures.landmarks_lines)
+    return lambda: monitor.update(next_line())
+
+@benchmark('monitor.update.pose_text')
+def _monitor_update_pose(fixtures):
+    monitor = head_pose.HeadPose(filters=copy.deepcopy(head_pose.DEFAULT_FILTERS))
+    next_line = _cycle(fixtures.pose_lines)
+    return lambda: monitor.update(next_line())
+
+@benchmark('monitor.update_frame.landmarks_binary')
+def _monitor_update_frame_landmarks(fixtures):
+    monitor = facial_landmarks.FacialLandmarks(filters=copy.deepcopy(facial_landmarks.DEFAULT_FILTERS))
+    reader = tracker_output.FrameReader(io.BytesIO(b''.join(
+        tracker_output.pack_frame(*frame) for frame in fixtures.landmarks_frames)))
+    def update():
+        frame = reader.read()
+        if frame is None:
+            reader.stream.seek(0)
+            frame = reader.read()
+        monitor.update_frame(frame)
+    return update
+
+@benchmark('facial_landmarks.on_update')
+def _facial_landmarks_on_update(fixtures):
+    monitor = facial_landmarks.FacialLandmarks(filters=copy.deepcopy(facial_landmarks.DEFAULT_FILTERS))
+    next_data = _cycle([tracker_output.parse_landmarks_line(line) for line in fixtures.landmarks_lines])
+    return lambda: monitor.on_update(next_data())
+
+# Filters
+
+FILTER_WINDOW_SIZE = 20
+FILTER_MODES = collections.OrderedDict([
+    ('poly', {'estimation_mode': ('poly', 3)}),
+    ('kernel', {'estimation_mode': ('kernel', signal_processing.half_gaussian_window(FILTER_WINDOW_SIZE, 10.0))}),
+    ('mean', {'estimation_mode': 'mean'}),
+    ('median', {'estimation_mode': 'median'}),
+    ('raw', {'estimation_mode': 'raw'}),
+    ('median_smoothed_poly', {'smoothing_mode': ('median', 5), 'estimation_mode': ('poly', 3)}),
+    ('convolve_smoothed_poly', {'smoothing_mode': ('convolve', signal_processing.gaussian_window(5, 1.0)),
+                                'estimation_mode': ('poly', 3)}),
+])
+
+def _filter_benchmark(make_filter, values):
+    def setup(fixtures):
+        filters = make_filter()
+        next_value = _cycle(values(fixtures))
+        def update():
+            filters.append(next_value())
+            filters.estimate_current()
+        return update
+    return setup
+
+def _scalar_values(fixtures):
+    return [float(keypoints[0, 0, 0]) for keypoints in fixtures.keypoints]
+
+def _landmark_values(fixtures):
+    return [keypoints[:, 0] for keypoints in fixtures.keypoints]
+
+for (_mode, _options) in FILTER_MODES.items():
+    benchmark('filter.sliding_window.' + _mode)(_filter_benchmark(
+        lambda options=_options: signal_processing.SlidingWindowFilter(FILTER_WINDOW_SIZE, **options),
+        _scalar_values))
+    benchmark('filter.filter_bank.' + _mode)(_filter_benchmark(
+        lambda options=_options: signal_processing.FilterBank(
+            (facial_landmarks.NUM_KEYPOINTS, 2), FILTER_WINDOW_SIZE, **options),
+        _landmark_values))
+benchmark('filter.kalman')(_filter_benchmark(signal_processing.KalmanFilter, _scalar_values))
+benchmark('filter.kalman_bank')(_filter_benchmark(
+    lambda: signal_processing.KalmanFilterBank((facial_landmarks.NUM_KEYPOINTS, 2)), _landmark_values))
+
+# Stereo model
+
+@benchmark('stereo.compute_3d_model.svd')
+def _compute_3d_model_svd(fixtures):
+    calibration = fixtures.make_calibration(triangulation_mode='svd')
+    next_keypoints = _cycle(fixtures.keypoints)
+    return lambda: calibration.compute_3d_model(next_keypoints())
+
+@benchmark('stereo.compute_3d_model.disparity')
+def _compute_3d_model_disparity(fixtures):
+    calibration = fixtures.make_calibration(triangulation_mode='disparity')
+    next_keypoints = _cycle(fixtures.keypoints)
+    return lambda: calibration.compute_3d_model(next_keypoints())
+
+def _points_3d(fixtures):
+    return [fixtures.calibration.compute_3d_model(keypoints) for keypoints in fixtures.keypoints]
+
+@benchmark('stereo.compute_RT')
+def _compute_RT(fixtures):
+    next_points_3d = _cycle(_points_3d(fixtures))
+    return lambda: fixtures.calibration.compute_RT(points_3d=next_points_3d())
+
+def _ransac_benchmark(**options):
+    def setup(fixtures):
+        calibration = fixtures.make_calibration()
+        next_points_3d = _cycle(_points_3d(fixtures))
+        return lambda: calibration.compute_RT_ransac(points_3d=next_points_3d(), threshold=2, **options)
+    return setup
+
+benchmark('stereo.compute_RT_ransac.sequential')(_ransac_benchmark(num_iter=50, mode='sequential'))
+benchmark('stereo.compute_RT_ransac.vectorized')(_ransac_benchmark(num_iter=50, mode='vectorized'))
+benchmark('stereo.compute_RT_ransac.adaptive')(_ransac_benchmark(
+    num_iter=50, mode='vectorized', confidence=0.99, min_iter=4, warm_start_ratio=0.9))
+
+def _gaze_benchmark(**options):
+    def setup(fixtures):
+        calibration = fixtures.make_calibration()
+        next_points_3d = _cycle(_points_3d(fixtures))
+        def solve():
+            try:
+                calibration.compute_gaze_location(points_3d=next_points_3d(), **options)
+            except stereo_util.NoIntersectionException:
+                pass
+        return solve
+    return setup
+
+benchmark('stereo.compute_gaze_location')(_gaze_benchmark())
+benchmark('stereo.compute_gaze_location.ransac')(_gaze_benchmark(**solver_process.DEFAULT_GAZE_OPTIONS))
+benchmark('stereo.compute_gaze_location.original')(_gaze_benchmark(**solver_process.ORIGINAL_GAZE_OPTIONS))
+
+# Screen transform
+
+@benchmark('transform.calibration_transform')
+def _calibration_transform(fixtures):
+    calibration = transform_util.Calibration()
+    next_pose = _cycle(fixtures.poses)
+    def transform():
+        pose = next_pose()
+        calibration.transform(0, 0, pose['pitch'], pose['yaw'], pose['roll'], pose['x'], pose['y'], pose['z'])
+    return transform
+
+# Rendering
+
+@benchmark('point_cloud.update_list_data')
+def _point_cloud_update_list_data(fixtures):
+    try:
+        import vispy.gloo
+        from visuals import point_cloud
+    except ImportError:
+        return None
+    # Only the staging of data into the vertex buffer is timed, so no GL context or shader
+    # program is needed
+    visual = point_cloud.PointCloudVisual.__new__(point_cloud.PointCloudVisual)
+    visual.framerate_counter = point_cloud.profiling.FramerateCounter()
+    visual.data_size = facial_landmarks.NUM_KEYPOINTS
+    visual.data = np.zeros(facial_landmarks.NUM_KEYPOINTS, [('a_position', np.float32, 3),
+                                                           ('a_color', np.float32, 3)])
+    visual.data_vbo = vispy.gloo.VertexBuffer(visual.data)
+    next_points_3d = _cycle(_points_3d(fixtures))
+    return lambda: visual.update_list_data(next_points_3d())
+
+# Measurement
+
+def measure(call, iterations=DEFAULT_ITERATIONS, max_time=DEFAULT_MAX_TIME, warmup=DEFAULT_WARMUP):
+    """Times individual calls, stopping after iterations calls or max_time seconds.
+
+    Returns:
+        An array of the latency of each call, in seconds.
+    """
+    for _ in range(warmup):
+        call()
+    latencies = np.empty(iterations)
+    timer = timeit.default_timer
+    deadline = timer() + max_time
+    for iteration in range(iterations):
+        start = timer()
+        call()
+        end = timer()
+        latencies[iteration] = end - start
+        if end > deadline:
+            return latencies[:iteration + 1]
+    return latencies
+
+def summarize(latencies):
+    """Summarizes per-call latencies (in s) as microsecond statistics and calls per second."""
+    summary = {
+        'iterations': len(latencies),
+        'mean': np.mean(latencies) * 1e6,
+        'min': np.min(latencies) * 1e6,
+        'max': np.max(latencies) * 1e6,
+        'throughput': len(latencies) / np.sum(latencies),
+    }
+    for (percentile, value) in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        summary['p{}'.format(percentile)] = value * 1e6
+    return summary
+
+def run_benchmarks(names=None, iterations=DEFAULT_ITERATIONS, max_time=DEFAULT_MAX_TIME,
+                   warmup=DEFAULT_WARMUP, seed=0, repeats=DEFAULT_REPEATS, log=None):
+    """Runs the benchmarks with the given names (all of them if None), repeats times in turn, so
+    that a slow spell of the machine affects each repeat of a benchmark differently.
+
+    Returns:
+        A dict from the names of the benchmarks which could run to summaries, whose statistics
+        are the medians of the statistics of the repeats.
+    """
+    np.random.seed(seed)
+    fixtures = Fixtures(seed=seed)
+    calls = collections.OrderedDict()
+    for name in (BENCHMARKS if names is None else names):
+        call = BENCHMARKS[name](fixtures)
+        if call is None:
+            if log is not None:
+                log(format_result(name, None))
+        else:
+            calls[name] = call
+    summaries = collections.defaultdict(list)
+    for _ in range(repeats):
+        for (name, call) in calls.items():
+            summaries[name].append(summarize(measure(call, iterations, max_time, warmup)))
+    results = collections.OrderedDict()
+    for name in calls:
+        results[name] = {key: float(np.median([summary[key] for summary in summaries[name]]))
+                         for key in summaries[name][0]}
+        results[name]['repeats'] = repeats
+        if log is not None:
+            log(format_result(name, results[name]))
+    return results
+
+def compare(results, baseline, metric=DEFAULT_METRIC, tolerance=DEFAULT_TOLERANCE):
+    """Compares results against baseline results.
+
+    Returns:
+        A dict from the names of benchmarks in both to the ratio of the metric to its baseline
+        value, and a list of the names whose ratio exceeds 1 + tolerance.
+    """
+    ratios = collections.OrderedDict()
+    for (name, summary) in results.items():
+        baseline_summary = baseline.get(name)
+        if baseline_summary is None:
+            continue
+        ratios[name] = summary[metric] / baseline_summary[metric]
+    regressions = [name for (name, ratio) in ratios.items() if ratio > 1 + tolerance]
+    return (ratios, regressions)
+
+def format_result(name, summary):
+    if summary is None:
+        return '{:<45} skipped'.format(name)
+    return '{:<45} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.0f}'.format(
+        name, summary['mean'], summary['p50'], summary['p90'], summary['p99'], summary['throughput'])
+
+def get_metadata():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the tracking hot paths.')
+    parser.add_argument('names', nargs='*', help='substrings of the names of benchmarks to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                        help='maximum number of timed calls per benchmark')
+    parser.add_argument('--max-time', type=float, default=DEFAULT_MAX_TIME,
+                        help='maximum number of seconds of timed calls per benchmark')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='untimed calls per benchmark')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='number of times to run each benchmark, whose statistics are the medians of the repeats')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results as JSON to this path')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='compare against the JSON results saved at this path, or skip the '
+                             'comparison if empty (default: the stored baseline, which is refreshed '
+                             'with --output benchmark_baseline.json)')
+    parser.add_argument('--metric', default=DEFAULT_METRIC,
+                        choices=['mean'] + ['p{}'.format(percentile) for percentile in PERCENTILES],
+                        help='latency statistic compared against the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fractional slowdown from the baseline which is flagged as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='exit with status 1 if any benchmark regressed, instead of only reporting it')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.list:
+        for name in BENCHMARKS:
+            print name
+        return 0
+    names = [name for name in BENCHMARKS
+             if not args.names or any(pattern in name for pattern in args.names)]
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        # Loaded before any results are saved, so that refreshing the baseline compares with the old one
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['benchmarks']
+
+    print '{:<45} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'benchmark (latencies in us)', 'mean', 'p50', 'p90', 'p99', 'calls/s')
+    results = run_benchmarks(names, args.iterations, args.max_time, args.warmup, args.seed, args.repeats,
+                             log=lambda line: sys.stdout.write(line + '\n'))
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({'metadata': get_metadata(), 'benchmarks': results}, output_file, indent=2,
+                      separators=(',', ': '), sort_keys=True)
+
+    if not args.baseline:
+        return 0
+    if baseline is None:
+        print
+        print 'No baseline at {}; save one with --output'.format(args.baseline)
+        return 0
+    (ratios, regressions) = compare(results, baseline, args.metric, args.tolerance)
+    print
+    print '{} relative to {}:'.format(args.metric, args.baseline)
+    for (name, ratio) in ratios.items():
+        print '{:<45} {:>7.2f}x{}'.format(name, ratio, '  REGRESSION' if name in regressions else '')
+    if regressions:
+        print '{} of {} benchmarks regressed by more than {:.0%}'.format(
+            len(regressions), len(ratios), args.tolerance)
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
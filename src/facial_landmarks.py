@@ -12,6 +12,10 @@ import numpy as np
 from utilities import signal_processing
 from utilities import profiling
 import monitoring
+import monitor_loop
+import sessions
+import stereo_sync
+import tracker_output
 
 _PACKAGE_PATH = path.dirname(sys.modules[__name__].__file__)
 _ROOT_PATH = path.dirname(_PACKAGE_PATH)
@@ -23,33 +27,127 @@ _FACIAL_LANDMARK_TRACKER_ARGS = [_FACIAL_LANDMARK_TRACKER_PATH, '--show',
 
 NUM_KEYPOINTS = 68
 
-DEFAULT_FILTERS = [[signal_processing.SlidingWindowFilter(
-                        20, estimation_mode=('kernel', signal_processing.half_gaussian_window(20, 10.0)))
-                    for j in range(2)]
-                   for i in range(NUM_KEYPOINTS)]
+DEFAULT_FILTERS = signal_processing.FilterBank(
+    (NUM_KEYPOINTS, 2), 20, estimation_mode=('kernel', signal_processing.half_gaussian_window(20, 10.0)))
+
+def make_calibration_filters():
+    """Makes the filters used by each camera's tracker while calibrating and responding."""
+    return signal_processing.FilterBank((NUM_KEYPOINTS, 2), 20, estimation_mode='mean')
 
 class FacialLandmarks(monitoring.Monitor):
     """Consumes facial landmark tracking stream from stdin and updates."""
-    def __init__(self, camera_index=0, filters=DEFAULT_FILTERS):
-        super(FacialLandmarks, self).__init__()
+    def __init__(self, camera_index=0, filters=DEFAULT_FILTERS, tracker_args=None, **kwargs):
+        """Initializes the facial landmark monitor.
+
+        Arguments:
+            tracker_args: if provided, the command line of a tracker to run instead of
+                gazr_estimate_facial_landmarks, such as synthetic.get_tracker_args().
+                The camera index is appended to it.
+            kwargs: options for monitoring.Monitor.
+        """
+        super(FacialLandmarks, self).__init__(**kwargs)
         self.parameters = np.zeros((NUM_KEYPOINTS, 2))
         self.filters = filters
         self.camera_index = camera_index
+        self.tracker_args = _FACIAL_LANDMARK_TRACKER_ARGS if tracker_args is None else tracker_args
 
         self.update_rate_counter = profiling.FramerateCounter()
 
+    def parse(self, line):
+        return tracker_output.parse_landmarks_line(line)
+
+    def parse_frame(self, frame):
+        return tracker_output.landmarks_from_frame(frame)
+
+    def to_faces(self, data):
+        return tracker_output.landmarks_to_faces(data)
+
     def on_update(self, data):
         if "face_0" in data:
-            parameters = np.array(data['face_0'])
-            for i in range(NUM_KEYPOINTS):
-                for j in range(2):
-                    self.filters[i][j].append(parameters[i,j])
-                    self.parameters[i,j] = self.filters[i][j].estimate_current()
+            self.filters.append(data['face_0'])
+            estimated = self.filters.estimate_current()
+            if estimated is None:
+                self.parameters.fill(np.nan)
+            else:
+                self.parameters[:] = estimated
             self.update_rate_counter.tick()
         self.updated = not np.any(np.isnan(self.parameters))
 
     def get_tracker_args(self):
-        args = list(_FACIAL_LANDMARK_TRACKER_ARGS)
+        args = list(self.tracker_args)
         args.append('--camera')
         args.append(str(self.camera_index))
         return args
+
+class StereoFacialLandmarks(object):
+    """Facial landmark trackers for the left and right cameras, monitored by one MonitorLoop,
+    whose samples are paired by capture time."""
+    def __init__(self, left_filters, right_filters, max_skew=stereo_sync.DEFAULT_MAX_SKEW,
+                 replay_path=None, replay_speed=1.0, pair_callback=None, **kwargs):
+        """
+        Arguments:
+            replay_path: if provided, the path of a session file which both trackers' frames
+                are played back from, instead of starting the trackers.
+            replay_speed: the speed of playback relative to real time, or None for as fast as
+                possible.
+            pair_callback: if provided, each pair is taken as soon as it is matched and passed
+                to pair_callback(keypoints, timestamp) in the thread of the MonitorLoop, rather
+                than waited for with get_pair.
+            kwargs: options for both FacialLandmarks, such as tracker_args or recorder.
+        """
+        (left_source, right_source) = (None, None)
+        if replay_path is not None:
+            left_source = sessions.ReplaySource(replay_path, 0, replay_speed)
+            right_source = sessions.ReplaySource(replay_path, 1, replay_speed)
+        self.left = FacialLandmarks(camera_index=0, filters=left_filters, replay_source=left_source, **kwargs)
+        self.right = FacialLandmarks(camera_index=1, filters=right_filters, replay_source=right_source, **kwargs)
+        self.pair_callback = pair_callback
+        self.monitor_loop = monitor_loop.MonitorLoop()
+        self.monitor_loop.add(self.left, self._update_left)
+        self.monitor_loop.add(self.right, self._update_right)
+        self.synchronizer = stereo_sync.TimestampedStereoSynchronizer(max_skew)
+
+    def _update_left(self, parameters):
+        self.synchronizer.put_left(parameters, self.left.frame_timestamp)
+        self._take_pair()
+
+    def _update_right(self, parameters):
+        self.synchronizer.put_right(parameters, self.right.frame_timestamp)
+        self._take_pair()
+
+    def _take_pair(self):
+        if self.pair_callback is None:
+            return
+        pair = self.get_pair(timeout=0)
+        if pair is not None:
+            self.pair_callback(*pair)
+
+    def get_pair(self, timeout=None):
+        """Waits for the newest pair, as for StereoSynchronizer.get_pair.
+
+        Returns:
+            An N x 2 x 2 array of the paired keypoints and the capture time of the pair, or None
+            if there was no pair.
+        """
+        pair = self.synchronizer.get_pair(timeout)
+        if pair is None:
+            return None
+        return (np.stack(pair, axis=1), self.synchronizer.pair_timestamp)
+
+    def reset_filters(self):
+        self.left.filters.reset()
+        self.right.filters.reset()
+
+    def run(self):
+        """Monitors both trackers in the calling thread until they have exited or stop has been
+        called."""
+        self.monitor_loop.run()
+
+    def run_async(self):
+        """Monitors both trackers in the MonitorLoop's thread."""
+        self.monitor_loop.run_async()
+
+    def stop(self):
+        """Stops both trackers, and wakes up any wait for a pair."""
+        self.monitor_loop.stop()
+        self.synchronizer.close()
@@ -12,6 +12,7 @@ import numpy as np
 from utilities import profiling
 from utilities import signal_processing
 import monitoring
+import tracker_output
 
 _PACKAGE_PATH = path.dirname(sys.modules[__name__].__file__)
 _ROOT_PATH = path.dirname(_PACKAGE_PATH)
@@ -36,24 +37,33 @@ DEFAULT_FILTERS = {
     'y': signal_processing.SlidingWindowThresholdFilter(threshold=0.005),
     'z': signal_processing.SlidingWindowThresholdFilter()
 }
-DEFAULT_FILTERS = {
-    'yaw': signal_processing.KalmanFilter(),
-    'pitch': signal_processing.KalmanFilter(),
-    'roll': signal_processing.KalmanFilter(),
-    'x': signal_processing.KalmanFilter(),
-    'y': signal_processing.KalmanFilter(),
-    'z': signal_processing.KalmanFilter()
-}
+DEFAULT_FILTERS = signal_processing.KalmanFilterBank((len(PARAMETERS),))
 
 class HeadPose(monitoring.Monitor):
     """Consumes head pose tracking stream from stdin and updates."""
-    def __init__(self, filters=DEFAULT_FILTERS):
-        super(HeadPose, self).__init__()
+    def __init__(self, filters=DEFAULT_FILTERS, **kwargs):
+        """Initializes the head pose monitor.
+
+        Arguments:
+            filters: either a dict of per-parameter filters, or a single filter bank over
+                all parameters in the order of PARAMETERS.
+            kwargs: options for monitoring.Monitor.
+        """
+        super(HeadPose, self).__init__(**kwargs)
         self.parameters = {parameter: None for parameter in PARAMETERS}
         self.filters = filters
 
         self.update_rate_counter = profiling.FramerateCounter()
 
+    def parse(self, line):
+        return tracker_output.parse_pose_line(line)
+
+    def parse_frame(self, frame):
+        return tracker_output.pose_from_frame(frame)
+
+    def to_faces(self, data):
+        return tracker_output.pose_to_faces(data)
+
     def on_update(self, data):
         if "face_0" in data:
             raw_data = {
@@ -64,9 +74,15 @@ class HeadPose(monitoring.Monitor):
                 'y': data['face_0']['z'],
                 'z': data['face_0']['x']
             }
-            for (parameter, raw_value) in raw_data.items():
-                self.filters[parameter].append(raw_value)
-                self.parameters[parameter] = self.filters[parameter].estimate_current()
+            if isinstance(self.filters, dict):
+                for (parameter, raw_value) in raw_data.items():
+                    self.filters[parameter].append(raw_value)
+                    self.parameters[parameter] = self.filters[parameter].estimate_current()
+            else:
+                self.filters.append([raw_data[parameter] for parameter in PARAMETERS])
+                estimated = self.filters.estimate_current()
+                if estimated is not None:
+                    self.parameters = dict(zip(PARAMETERS, estimated))
             self.update_rate_counter.tick()
         self.updated = all(filtered_value is not None for filtered_value in self.parameters.values())
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python2
+"""Calibration and gaze response without a display.
+
+HeadlessCursorPipeline runs the same calibration state machine and gaze solving as
+animation.CalibratedCursorAnimator, but without a render.RenderingPipeline: trackers are
+monitored by a MonitorLoop in the calling thread, calibration is started and finished by
+method calls or after a number of stable frames instead of key presses, and each gaze result
+is passed to a sink instead of a visual node. Trackers may be live, synthetic or replayed from
+a session file, e.g.
+
+    python headless.py --replay session.gzrs --speed 0 --output gaze.csv
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+import transforms3d
+
+import facial_landmarks
+import sessions
+import solver_process
+import stereo_sync
+import synthetic
+
+DEFAULT_STABLE_FRAMES = 30
+
+class CSVSink(object):
+    """Writes solver_process.GazeResults as comma-separated values, with the columns of both
+    log_cursor.py and log_pose.py."""
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.stream.write('t (sample #), timestamp (s), target_x (px), target_y (px), '
+                          'x (cm), y (cm), z (cm), roll (deg), pitch (deg), yaw (deg)\n')
+
+    def __call__(self, result):
+        if result.target_px is None:
+            return
+        try:
+            (angle_z, angle_y, angle_x) = np.rad2deg(transforms3d.taitbryan.mat2euler(result.rotation))
+        except ValueError:
+            (angle_z, angle_y, angle_x) = (np.nan, np.nan, np.nan)
+        values = ([result.sample, result.timestamp] + list(result.target_px) + list(result.translation)
+                  + [angle_z, angle_y, angle_x])
+        self.stream.write(', '.join(str(value) for value in values) + '\n')
+
+class HeadlessCursorPipeline(object):
+    """Runs a solver_process.GazeCursor on pairs of keypoints from StereoFacialLandmarks, and
+    passes each gaze result to a sink."""
+    def __init__(self, sink=None, auto_calibrate=True, stable_frames=DEFAULT_STABLE_FRAMES,
+                 stability_threshold=solver_process.DEFAULT_STABILITY_THRESHOLD, use_solver_process=False,
+                 gaze_options=solver_process.DEFAULT_GAZE_OPTIONS, max_skew=stereo_sync.DEFAULT_MAX_SKEW,
+                 replay_path=None, replay_speed=None, **tracker_options):
+        """
+        Arguments:
+            sink: a callable taking each solver_process.GazeResult, such as a CSVSink or
+                list.append.
+            auto_calibrate: whether run starts calibrating, if start_calibrating was not called.
+            stable_frames, stability_threshold, use_solver_process, gaze_options: options for
+                the GazeCursor. If stable_frames is None, calibration only finishes when
+                start_responding is called.
+            max_skew, replay_path, replay_speed, tracker_options: options for the
+                StereoFacialLandmarks, such as tracker_args, binary or recorder.
+        """
+        self.sink = sink
+        self.auto_calibrate = auto_calibrate
+        self.cursor = solver_process.GazeCursor(gaze_options, use_solver_process, stable_frames,
+                                                stability_threshold)
+        self.trackers = facial_landmarks.StereoFacialLandmarks(
+            facial_landmarks.make_calibration_filters(), facial_landmarks.make_calibration_filters(),
+            max_skew, replay_path, replay_speed, pair_callback=self.on_update, **tracker_options)
+        self.pairs_processed = 0
+        self._start_time = None
+        self._end_time = None
+
+    @property
+    def state(self):
+        return self.cursor.state
+
+    def start_calibrating(self):
+        self.cursor.start_calibrating()
+        self.trackers.reset_filters()
+
+    def start_responding(self):
+        """Finishes calibrating with the newest keypoints, and starts solving for the gaze."""
+        self.cursor.start_responding()
+        self.trackers.reset_filters()
+
+    def run(self):
+        """Runs the trackers and the pipeline in the calling thread until all trackers have
+        exited or stop has been called.
+
+        Returns:
+            The statistics of the run, as from get_statistics.
+        """
+        if self.auto_calibrate and self.state == 'ready':
+            self.start_calibrating()
+        self._start_time = time.time()
+        self.trackers.run()
+        self._end_time = time.time()
+        self.cursor.stop()
+        return self.get_statistics()
+
+    def stop(self):
+        """Stops the trackers, which ends run. May be called from the sink or another thread."""
+        self.trackers.stop()
+
+    def on_update(self, keypoints, timestamp):
+        """Handles paired keypoints captured at timestamp."""
+        self.pairs_processed += 1
+        state = self.cursor.state
+        result = self.cursor.update(keypoints, timestamp)
+        if self.cursor.state != state:
+            # Calibration finished by itself; respond with fresh filters, as start_responding does
+            self.trackers.reset_filters()
+        if result is not None and self.sink is not None:
+            self.sink(result)
+
+    def get_statistics(self):
+        """Returns the numbers of pairs and results, the throughput in pairs per second, and the
+        numbers of frames from each tracker which were never paired."""
+        end_time = time.time() if self._end_time is None else self._end_time
+        elapsed = 0.0 if self._start_time is None else end_time - self._start_time
+        return {
+            'state': self.state,
+            'pairs': self.pairs_processed,
+            'results': self.cursor.results_produced,
+            'elapsed': elapsed,
+            'throughput': self.pairs_processed / elapsed if elapsed else None,
+            'frames_discarded': self.trackers.synchronizer.get_frames_discarded(),
+        }
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Calibrate and solve for the gaze location without a display.')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--replay', help='play back the trackers from this session file')
+    source.add_argument('--synthetic', choices=sorted(synthetic.TRAJECTORIES),
+                        help='run synthetic trackers with this head trajectory')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='replay speed relative to real time, or 0 for as fast as possible')
+    parser.add_argument('--frames', type=int, default=300, help='number of synthetic frames')
+    parser.add_argument('--binary', action='store_true', help='run the trackers in their binary output mode')
+    parser.add_argument('--record', help='record the trackers into this session file')
+    parser.add_argument('--stable-frames', type=int, default=DEFAULT_STABLE_FRAMES,
+                        help='finish calibrating after this many consecutive stable pairs, or 0 to '
+                             'calibrate on the first pair')
+    parser.add_argument('--stability-threshold', type=float, default=solver_process.DEFAULT_STABILITY_THRESHOLD,
+                        help='mean keypoint motion between stable pairs, in px')
+    parser.add_argument('--solver-process', action='store_true',
+                        help='solve for the gaze location in a worker process')
+    parser.add_argument('--original-ransac', action='store_true',
+                        help='solve with the original sequential RANSAC instead of the faster default')
+    parser.add_argument('--output', help='write the gaze results as CSV to this path instead of stdout')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    tracker_options = {'binary': args.binary}
+    if args.synthetic is not None:
+        tracker_options['tracker_args'] = synthetic.get_tracker_args(trajectory=args.synthetic,
+                                                                     frames=args.frames)
+    recorder = None
+    if args.record is not None:
+        recorder = tracker_options['recorder'] = sessions.SessionRecorder(args.record)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+
+    pipeline = HeadlessCursorPipeline(
+        CSVSink(output), stable_frames=args.stable_frames, stability_threshold=args.stability_threshold,
+        use_solver_process=args.solver_process,
+        gaze_options=solver_process.ORIGINAL_GAZE_OPTIONS if args.original_ransac else solver_process.DEFAULT_GAZE_OPTIONS,
+        replay_path=args.replay,
+        replay_speed=args.speed or None, **tracker_options)
+    try:
+        statistics = pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
+        statistics = pipeline.get_statistics()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if output is not sys.stdout:
+            output.close()
+    sys.stderr.write('{state}: {pairs} pairs, {results} results in {elapsed:.2f} s; '
+                     'frames discarded: {frames_discarded}\n'.format(**statistics))
+    if statistics['throughput'] is not None:
+        sys.stderr.write('{:.1f} pairs/s\n'.format(statistics['throughput']))
+
+if __name__ == '__main__':
+    main()
@@ -14,31 +14,11 @@ class CSVLogger(animation.CalibratedCursorAnimator):
         self.t = 0
         super(CSVLogger, self).__init__()
 
-    def _update_head(self, parameters):
-        try:
-            points_3d = stereo_util.compute_3d_model(parameters, self.calibration._camera_matrices)
-            points_3d_filtered = np.empty_like(points_3d)
-            for i in range(facial_landmarks.NUM_KEYPOINTS):
-                for j in range(3):
-                    self.points_3d_filters[i][j].append(points_3d[i,j])
-                    points_3d_filtered[i,j] = self.points_3d_filters[i][j].estimate_current()
-            target = self.calibration.compute_gaze_location(points_3d=points_3d_filtered, use_ransac=True,
-                                                            threshold=2, num_iter=50)
-            target_px = transform_util.screen_xy_to_render_xy(*target)
-            target_px = -2 * np.array([target_px[0], target_px[1]])
-            for i in range(2):
-                self.target_filters[i].append(target_px[i])
-            target_px = np.array([[self.target_filters[0].estimate_current(),
-                                   self.target_filters[1].estimate_current(), 0.0]],
-                                 dtype='f')
-            if not np.any(np.isnan(target_px)):
-                self._visual_node.update_list_data(target_px)
-                self.framerate_counter.tick()
-                self._pipeline.update()
-                print str(self.t) + ', ' + str(target_px[0][0]) + ', ' + str(target_px[0][1])
-                self.t += 1
-        except stereo_util.NoIntersectionException:
-            pass
+    def _update_target(self, result):
+        target_px = super(CSVLogger, self)._update_target(result)
+        if target_px is not None:
+            print str(self.t) + ', ' + str(target_px[0][0]) + ', ' + str(target_px[0][1])
+            self.t += 1
 
 VIEW_PRESETS = scene_manager.VIEW_PRESETS
 
@@ -5,6 +5,7 @@ import facial_landmarks
 import render
 import scene_manager
 import animation
+import solver_process
 
 class CSVLogger(animation.CalibratedCursorAnimator):
     def __init__(self):
@@ -13,7 +14,8 @@ class CSVLogger(animation.CalibratedCursorAnimator):
         super(CSVLogger, self).__init__()
 
     def _update_head(self, parameters):
-        (rotation, translation, _) = self.calibration.compute_RT_ransac(points=parameters, threshold=2, num_iter=50)
+        (rotation, translation, _) = self.calibration.compute_RT_ransac(
+            points=parameters, **solver_process.get_ransac_options(solver_process.DEFAULT_GAZE_OPTIONS))
         try:
             (angle_z, angle_y, angle_x) = np.rad2deg(transforms3d.taitbryan.mat2euler(rotation))
         except ValueError:
@@ -0,0 +1,174 @@
+"""Single-threaded event loop which monitors several trackers at once."""
+import os
+import select
+import threading
+
+import tracker_output
+import shared_frames
+import monitoring
+
+_READ_SIZE = 65536
+
+def make_consumer(consumer):
+    """Adapts a consumer of monitor parameters into a function of the parameters.
+
+    Arguments:
+        consumer: None, a callback as passed to Monitor.monitor_sync, or a generator-based
+            coroutine to which parameters are sent; the coroutine is primed here.
+    """
+    if consumer is None:
+        return lambda parameters: None
+    if hasattr(consumer, 'send'):
+        next(consumer)
+        return consumer.send
+    return consumer
+
+class _MonitoredTracker(object):
+    """The state of one tracker's stream in a MonitorLoop."""
+    def __init__(self, monitor, consumer):
+        self.monitor = monitor
+        self.consume = make_consumer(consumer)
+        self.buffer = bytearray()
+        self.process = None
+        self.reader = None
+        self.pending_frame = None
+
+    def extract_samples(self):
+        """Removes the complete lines or frames from the buffer."""
+        if self.monitor.binary:
+            (frames, num_bytes) = tracker_output.unpack_frames(self.buffer)
+            del self.buffer[:num_bytes]
+            return frames
+        end = self.buffer.rfind(b'\n') + 1
+        if not end:
+            return []
+        lines = bytes(self.buffer[:end]).splitlines(True)
+        del self.buffer[:end]
+        return lines
+
+    def dispatch(self, samples):
+        """Updates the monitor from samples, calling the consumer for fresh parameters."""
+        monitor = self.monitor
+        if monitor.drain_backlog:
+            monitor.update_backlog(samples)
+            if monitor.updated:
+                self.consume(monitor.parameters)
+            return
+        for sample in samples:
+            if isinstance(sample, tracker_output.Frame):
+                monitor.update_frame(sample)
+            else:
+                monitor.update(sample)
+            if monitor.updated:
+                self.consume(monitor.parameters)
+
+class MonitorLoop(object):
+    """Reads the output of several trackers in one thread.
+
+    Streams from tracker stdout pipes are multiplexed with select, rather than each Monitor
+    blocking its own thread; shared-memory rings are polled between selects, and replayed
+    frames are dispatched as they fall due. Each monitor's binary, shared_memory_path,
+    drain_backlog, recorder and replay_source options are respected.
+    """
+    def __init__(self, poll_interval=monitoring.SHARED_MEMORY_POLL_INTERVAL):
+        self._trackers = []
+        self._running = False
+        self._loop_thread = None
+        self.poll_interval = poll_interval
+
+    def add(self, monitor, consumer=None):
+        """Adds a monitor, whose tracker is started when the loop runs.
+
+        Arguments:
+            consumer: a callback taking the monitor's parameters after each update, or a
+                generator-based coroutine to which they are sent.
+        """
+        self._trackers.append(_MonitoredTracker(monitor, consumer))
+
+    def _read_shared_memory(self, tracker):
+        monitor = tracker.monitor
+        if tracker.reader is None:
+            tracker.reader = shared_frames.open_reader(monitor.shared_memory_path, timeout=0)
+            if tracker.reader is None:
+                return
+        frame = tracker.reader.read_latest()
+        if frame is not None:
+            monitor.frames_dropped = tracker.reader.frames_skipped
+            tracker.dispatch([frame])
+
+    def _replay_due_frames(self, replayed):
+        """Dispatches the replayed frames which are due, in order of their timestamps across all
+        replayed trackers, so that trackers played back faster than real time stay interleaved."""
+        while self._running:
+            due = [tracker for tracker in replayed
+                   if tracker.monitor.replay_source.get_delay(tracker.pending_frame) <= 0]
+            if not due:
+                return
+            tracker = min(due, key=lambda tracker: tracker.pending_frame.timestamp)
+            tracker.dispatch([tracker.pending_frame])
+            tracker.pending_frame = tracker.monitor.replay_source.next_frame()
+            if tracker.pending_frame is None:
+                replayed.remove(tracker)
+
+    def run(self):
+        """Starts the trackers and dispatches their output until all of them have exited or
+        stop has been called."""
+        self._running = True
+        (piped, shared, replayed) = ({}, [], [])
+        for tracker in self._trackers:
+            monitor = tracker.monitor
+            if monitor.replay_source is not None:
+                monitor.replay_source.start()
+                tracker.pending_frame = monitor.replay_source.next_frame()
+                if tracker.pending_frame is not None:
+                    replayed.append(tracker)
+                continue
+            monitor._start_tracker()
+            tracker.process = monitor._tracker_process
+            if monitor.shared_memory_path is None:
+                piped[tracker.process.stdout.fileno()] = tracker
+            else:
+                shared.append(tracker)
+        while self._running and (piped or shared or replayed):
+            timeout = self.poll_interval if shared else None
+            for tracker in replayed:
+                delay = max(tracker.monitor.replay_source.get_delay(tracker.pending_frame), 0)
+                timeout = delay if timeout is None else min(timeout, delay)
+            (readable, _, _) = select.select(list(piped), [], [], timeout)
+            for fd in readable:
+                tracker = piped[fd]
+                data = os.read(fd, _READ_SIZE)
+                if not data:
+                    del piped[fd]
+                    continue
+                tracker.buffer.extend(data)
+                samples = tracker.extract_samples()
+                if samples:
+                    tracker.dispatch(samples)
+            for tracker in list(shared):
+                if tracker.process.poll() is not None:
+                    shared.remove(tracker)
+                else:
+                    self._read_shared_memory(tracker)
+            self._replay_due_frames(replayed)
+        self._running = False
+
+    def run_async(self):
+        """Runs the loop in a single thread.
+
+        Threading:
+            Instantiates a singleton thread named MonitorLoop.
+        """
+        if self._loop_thread is not None:
+            return
+        self._loop_thread = threading.Thread(target=self.run, name=self.__class__.__name__)
+        self._loop_thread.start()
+
+    def stop(self):
+        """Stops all trackers, and joins the loop's thread if it was started."""
+        self._running = False
+        for tracker in self._trackers:
+            tracker.monitor.stop_monitoring()
+        if self._loop_thread is not None:
+            self._loop_thread.join()
+            self._loop_thread = None
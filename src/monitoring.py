@@ -1,15 +1,54 @@
 import sys
+import ast
+import time
 import subprocess
 import threading
+
+import numpy as np
+
+import tracker_output
+import shared_frames
 try:
     from Queue import Queue, Empty
 except ImportError:
     from queue import Queue, Empty
 
+SHARED_MEMORY_POLL_INTERVAL = 0.0001
+
 class Monitor(object):
     """Monitors a stream from stdin."""
-    def __init__(self):
+    def __init__(self, binary=False, shared_memory_path=None, drain_backlog=False, feed_skipped=False,
+                 recorder=None, replay_source=None):
+        """Initializes the monitor.
+
+        Arguments:
+            binary: whether to run the tracker in its binary output mode rather than its text mode.
+            shared_memory_path: if provided, the tracker writes binary frames into a shared-memory
+                ring at this path (e.g. under /dev/shm) instead of its stdout, and only the newest
+                frame is read whenever the ring is polled.
+            drain_backlog: whether to read tracker output on a separate thread and, whenever the
+                callback falls behind, process only the newest sample for each face, so that
+                latency stays bounded when the callback is slower than the tracker.
+            feed_skipped: whether samples superseded while draining the backlog are still
+                passed to on_update (e.g. to keep filters fed) rather than dropped.
+            recorder: if provided, a sessions.SessionRecorder which every frame from the tracker
+                is recorded into, including frames later dropped from a backlog.
+            replay_source: if provided, a sessions.ReplaySource which frames are played back
+                from instead of starting the tracker.
+        """
         self.updated = False
+        self.binary = binary
+        self.shared_memory_path = shared_memory_path
+        self.drain_backlog = drain_backlog
+        self.feed_skipped = feed_skipped
+        self.frame_id = None
+        self.frame_timestamp = None
+        self.frames_dropped = 0
+        self.frames_coalesced = 0
+        self.camera_index = 0
+        self.recorder = recorder
+        self.replay_source = replay_source
+        self._num_lines_parsed = 0
         self._tracker_process = None
         self._monitor_thread = None
 
@@ -18,6 +57,11 @@ class Monitor(object):
         If data is updated, needs to set self.updated to True."""
         pass
 
+    def parse(self, line):
+        """Parses a line of tracker output into a sample of data for on_update.
+        Subclasses should override this with a parser specialized to their tracker's output."""
+        return ast.literal_eval(line)
+
     def update(self, line=None):
         """Synchronously updates parameters once from the stdin buffer.
 
@@ -26,18 +70,62 @@ class Monitor(object):
         """
         if line is None:
             line = sys.stdin.readline()
-        data = eval(line)
+        data = self.parse(line)
+        self._record_data(data)
         self.on_update(data)
 
+    def parse_frame(self, frame):
+        """Converts a tracker_output.Frame into a sample of data for on_update.
+        Subclasses should override this to match the structure returned by parse."""
+        return {'face_{}'.format(index): face for (index, face) in enumerate(frame.faces)}
+
+    def to_faces(self, data):
+        """Converts a sample of data from parse into a num_faces x values_per_face array, the
+        inverse of parse_frame. Subclasses should override this to match parse_frame."""
+        return np.array([np.ravel(data['face_{}'.format(index)]) for index in range(len(data))])
+
+    def _record_data(self, data):
+        """Records a sample of data parsed from a line of tracker output, if recording."""
+        if self.recorder is not None:
+            self.recorder.record(self.camera_index, self._num_lines_parsed, time.time(),
+                                 self.to_faces(data))
+        self._num_lines_parsed += 1
+
+    def _record_frame(self, frame):
+        if self.recorder is not None:
+            self.recorder.record(self.camera_index, frame.frame_id, frame.timestamp, frame.faces)
+
+    def update_frame(self, frame):
+        """Synchronously updates parameters once from a binary tracker frame.
+
+        Arguments:
+            frame: a tracker_output.Frame. Its values may be overwritten after this returns.
+        """
+        self.frame_id = frame.frame_id
+        self.frame_timestamp = frame.timestamp
+        self._record_frame(frame)
+        self.on_update(self.parse_frame(frame))
+
+    def get_tracker_args(self):
+        """Returns the command line of the external tracking program."""
+        raise NotImplementedError
+
     def _start_tracker(self):
         """Starts the external head pose tracking program.
         The program's stdout is piped to the current stdin.
         """
         on_posix = 'posix' in sys.builtin_module_names
 
-        self._tracker_process = subprocess.Popen(self.get_tracker_args(),
-                                                 stdout=subprocess.PIPE,
-                                                 bufsize=1, close_fds=on_posix)
+        args = self.get_tracker_args()
+        if self.shared_memory_path is not None:
+            self._tracker_process = subprocess.Popen(args + ['--shm', self.shared_memory_path],
+                                                     close_fds=on_posix)
+            return
+        if self.binary:
+            args = args + ['--binary']
+        self._tracker_process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                                 bufsize=-1 if self.binary else 1,
+                                                 close_fds=on_posix)
 
     def monitor_sync(self, callback=None):
         """Synchronously updates parameters continuously from stdin.
@@ -45,12 +133,117 @@ class Monitor(object):
         Arguments:
             callback: If provided, calls callback after each update with the parameters.
         """
+        if self.replay_source is not None:
+            self.replay_source.start()
+            for frame in self.replay_source:
+                self.update_frame(frame)
+                if self.updated:
+                    callback(self.parameters)
+            return
         self._start_tracker()
+        if self.shared_memory_path is not None:
+            self._monitor_shared_memory(callback)
+            return
+        if self.drain_backlog:
+            self._monitor_draining(callback)
+            return
+        if self.binary:
+            for frame in tracker_output.FrameReader(self._tracker_process.stdout):
+                self.update_frame(frame)
+                if self.updated:
+                    callback(self.parameters)
+            return
         for line in iter(self._tracker_process.stdout.readline, b''):
             self.update(line)
             if self.updated:
                 callback(self.parameters)
 
+    def _monitor_shared_memory(self, callback):
+        """Polls the tracker's shared-memory ring for new frames until the tracker exits."""
+        process = self._tracker_process
+        is_alive = lambda: process.poll() is None
+        reader = shared_frames.open_reader(self.shared_memory_path, is_alive=is_alive)
+        if reader is None:
+            return
+        while is_alive():
+            frame = reader.read_latest()
+            if frame is None:
+                time.sleep(SHARED_MEMORY_POLL_INTERVAL)
+                continue
+            self.frames_dropped = reader.frames_skipped
+            self.update_frame(frame)
+            if self.updated:
+                callback(self.parameters)
+
+    def _read_samples(self, samples):
+        """Puts the tracker's output lines or frames into the samples queue until it exits."""
+        stdout = self._tracker_process.stdout
+        if self.binary:
+            for frame in tracker_output.FrameReader(stdout):
+                samples.put(frame._replace(faces=frame.faces.copy()))
+        else:
+            for line in iter(stdout.readline, b''):
+                samples.put(line)
+        samples.put(None)
+
+    def _parse_sample(self, sample):
+        if isinstance(sample, tracker_output.Frame):
+            self.frame_id = sample.frame_id
+            self.frame_timestamp = sample.timestamp
+            self._record_frame(sample)
+            return self.parse_frame(sample)
+        data = self.parse(sample)
+        self._record_data(data)
+        return data
+
+    def update_backlog(self, samples):
+        """Synchronously updates parameters once from a backlog of samples, oldest first.
+
+        Arguments:
+            samples: tracker output lines or tracker_output.Frames.
+        """
+        if self.feed_skipped:
+            for sample in samples:
+                self.on_update(self._parse_sample(sample))
+            self.frames_coalesced += len(samples) - 1
+            return
+        newest = {}
+        (frame_id, frame_timestamp) = (self.frame_id, self.frame_timestamp)
+        for sample in samples:
+            data = self._parse_sample(sample)
+            if data:
+                newest.update(data)
+                # Stamp the update with the sample its faces came from, not a later faceless one
+                (frame_id, frame_timestamp) = (self.frame_id, self.frame_timestamp)
+        (self.frame_id, self.frame_timestamp) = (frame_id, frame_timestamp)
+        self.on_update(newest)
+        self.frames_dropped += len(samples) - 1
+
+    def _monitor_draining(self, callback):
+        """Updates from the newest tracker output whenever the previous callback has finished."""
+        samples = Queue()
+        reader_thread = threading.Thread(target=self._read_samples, args=(samples,),
+                                         name=self.__class__.__name__ + 'Reader')
+        reader_thread.daemon = True
+        reader_thread.start()
+        finished = False
+        while not finished:
+            backlog = [samples.get()]
+            while True:
+                try:
+                    backlog.append(samples.get_nowait())
+                except Empty:
+                    break
+            if backlog[-1] is None:
+                finished = True
+                backlog.pop()
+            if not backlog:
+                continue
+            self.update_backlog(backlog)
+            if self.updated:
+                callback(self.parameters)
+        reader_thread.join()
+
     def monitor_async(self, callback=None):
         """Asynchronously updates parameters continuously from stdin.
 
@@ -70,8 +263,11 @@ class Monitor(object):
         Stops the tracker process, if it exists.
         Stops the asynchronous monitor, if it was started.
         """
+        if self.replay_source is not None:
+            self.replay_source.stop()
         if self._tracker_process is not None:
-            self._tracker_process.terminate()
+            if self._tracker_process.poll() is None:
+                self._tracker_process.terminate()
             self._tracker_process.wait()
             self._tracker_process = None
         if self._monitor_thread is not None:
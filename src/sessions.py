@@ -0,0 +1,125 @@
+"""Recording and replay of tracker frames, for benchmarking without cameras.
+
+A session file is SESSION_HEADER followed by records, each of which is RECORD_HEADER with the
+index of the camera which captured the frame, then the frame in the binary format of
+tracker_output.pack_frame.
+"""
+import time
+import struct
+import threading
+
+import numpy as np
+
+import tracker_output
+
+SESSION_MAGIC = b'GZRS'
+SESSION_VERSION = 1
+SESSION_HEADER = struct.Struct('<4sI')  # magic, version
+RECORD_HEADER = struct.Struct('<I')  # camera index
+
+class SessionRecorder(object):
+    """Writes frames from any number of monitors into a session file.
+    Monitors which record into the same recorder may run in different threads."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION))
+        self._lock = threading.Lock()
+        self.frames_recorded = 0
+
+    def record(self, camera_index, frame_id, timestamp, faces):
+        """Appends a frame.
+
+        Arguments:
+            faces: a num_faces x values_per_face array of values.
+        """
+        record = RECORD_HEADER.pack(camera_index) + tracker_output.pack_frame(frame_id, timestamp, faces)
+        with self._lock:
+            self._file.write(record)
+            self.frames_recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def read_session(path, camera_index=None):
+    """Yields (camera index, tracker_output.Frame) for each frame in a session file.
+
+    Arguments:
+        camera_index: if provided, only frames from this camera are yielded.
+    """
+    with open(path, 'rb') as session_file:
+        (magic, version) = SESSION_HEADER.unpack(session_file.read(SESSION_HEADER.size))
+        if magic != SESSION_MAGIC or version != SESSION_VERSION:
+            raise ValueError('{} is not a version {} session file'.format(path, SESSION_VERSION))
+        reader = tracker_output.FrameReader(session_file)
+        while True:
+            record_header = session_file.read(RECORD_HEADER.size)
+            if len(record_header) < RECORD_HEADER.size:
+                return
+            (record_camera_index,) = RECORD_HEADER.unpack(record_header)
+            frame = reader.read()
+            if frame is None:
+                return
+            if camera_index is None or record_camera_index == camera_index:
+                yield (record_camera_index, frame._replace(faces=frame.faces.copy()))
+
+class ReplaySource(object):
+    """Plays back one camera's frames from a session file, in place of a tracker process.
+
+    Frames keep their recorded timestamps, and are released with the same spacing as they
+    were recorded at, divided by speed. Time is measured from the first frame of the whole
+    session, so sources for each camera of a session keep the recorded offsets between them.
+    """
+    def __init__(self, path, camera_index=0, speed=1.0):
+        """
+        Arguments:
+            speed: the playback speed relative to real time, or None to play back as fast as
+                possible.
+        """
+        self.path = path
+        self.camera_index = camera_index
+        self.speed = speed
+        self._frames = None
+        self._start_time = None
+        self._first_timestamp = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts (or restarts) playback from the beginning of the session."""
+        first_record = next(read_session(self.path), None)
+        self._first_timestamp = None if first_record is None else first_record[1].timestamp
+        self._frames = (frame for (_, frame) in read_session(self.path, self.camera_index))
+        self._start_time = time.time()
+        self._stopped.clear()
+
+    def next_frame(self):
+        """Returns the next frame without waiting for it to be due, or None at the end."""
+        if self._frames is None:
+            self.start()
+        if self._stopped.is_set():
+            return None
+        return next(self._frames, None)
+
+    def get_delay(self, frame):
+        """Returns the time in seconds until frame is due to be played back."""
+        if self.speed is None:
+            return 0
+        due_time = self._start_time + (frame.timestamp - self._first_timestamp) / self.speed
+        return due_time - time.time()
+
+    def read(self):
+        """Waits until the next frame is due and returns it, or returns None at the end."""
+        frame = self.next_frame()
+        if frame is not None:
+            delay = self.get_delay(frame)
+            if delay > 0 and self._stopped.wait(delay):
+                return None
+        return frame
+
+    def __iter__(self):
+        return iter(self.read, None)
+
+    def stop(self):
+        """Ends playback, waking up any wait for the next frame."""
+        self._stopped.set()
@@ -0,0 +1,222 @@
+"""Shared-memory ring transport for binary tracker frames.
+
+The ring is a file (normally under /dev/shm) which the tracker maps and writes frames into,
+so that frames reach Python without passing through a pipe. The layout must match
+SharedFrameRing in ext/gazr/tools/binary_output.hpp:
+
+    ring header (RING_HEADER, padded to RING_HEADER_SIZE bytes)
+    num_slots slots of slot_size bytes, each holding:
+        sequence number (SLOT_HEADER), odd while the slot is being written
+        frame header (tracker_output.FRAME_HEADER)
+        num_faces * values_per_face packed float32 values
+
+The ring header's num_written counts completed frames, so the newest completed frame is in
+slot (num_written - 1) % num_slots.
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+
+import numpy as np
+
+import tracker_output
+
+RING_MAGIC = b'GZRR'
+RING_HEADER = struct.Struct('<4sIIIQ')  # magic, num_slots, slot_size, reserved, num_written
+RING_HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<Q')  # sequence
+_NUM_WRITTEN_OFFSET = 16
+_FRAME_OFFSET = SLOT_HEADER.size + tracker_output.FRAME_HEADER.size
+
+DEFAULT_PATH = '/dev/shm/gazr_frames'
+DEFAULT_NUM_SLOTS = 8
+MAX_READ_ATTEMPTS = 10
+READ_RETRY_INTERVAL = 0.0005  # s
+
+def get_slot_size(capacity):
+    """Returns the size in bytes of a slot holding up to capacity float32 values."""
+    return (_FRAME_OFFSET + 4 * capacity + 7) // 8 * 8
+
+class SharedFrameWriter(object):
+    """Writes binary frames into a shared-memory ring.
+    A pure-Python stand-in for the writer in the gazr tools."""
+    def __init__(self, path=DEFAULT_PATH, capacity=8 * 136, num_slots=DEFAULT_NUM_SLOTS):
+        """Creates the ring file, replacing any existing one.
+
+        Arguments:
+            capacity: the maximum number of float32 values in a frame.
+        """
+        self.path = path
+        self.num_slots = num_slots
+        self.slot_size = get_slot_size(capacity)
+        self.capacity = capacity
+        self.num_written = 0
+
+        size = RING_HEADER_SIZE + num_slots * self.slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        RING_HEADER.pack_into(self._map, 0, RING_MAGIC, num_slots, self.slot_size, 0, 0)
+
+    def write(self, frame_id, timestamp, faces):
+        """Writes a frame into the oldest slot and publishes it as the newest frame.
+
+        Arguments:
+            faces: a num_faces x values_per_face array of values.
+        """
+        faces = np.asarray(faces, dtype='<f4')
+        faces = faces.reshape(len(faces), -1) if len(faces) else faces.reshape(0, 0)
+        if faces.size > self.capacity:
+            raise ValueError('Frame of {} values exceeds ring capacity {}'.format(faces.size, self.capacity))
+        offset = RING_HEADER_SIZE + (self.num_written % self.num_slots) * self.slot_size
+        (sequence,) = SLOT_HEADER.unpack_from(self._map, offset)
+        SLOT_HEADER.pack_into(self._map, offset, sequence + 1)
+        tracker_output.FRAME_HEADER.pack_into(self._map, offset + SLOT_HEADER.size, tracker_output.FRAME_MAGIC,
+                                              faces.shape[0], faces.shape[1], 0, frame_id, timestamp)
+        if faces.size:
+            np.frombuffer(self._map, dtype='<f4', count=faces.size,
+                          offset=offset + _FRAME_OFFSET)[:] = faces.ravel()
+        SLOT_HEADER.pack_into(self._map, offset, sequence + 2)
+        self.num_written += 1
+        struct.pack_into('<Q', self._map, _NUM_WRITTEN_OFFSET, self.num_written)
+
+    def close(self, unlink=True):
+        self._map.close()
+        if unlink and os.path.exists(self.path):
+            os.unlink(self.path)
+
+class SharedFrameReader(object):
+    """Reads the newest completed frame from a shared-memory ring."""
+    def __init__(self, path=DEFAULT_PATH):
+        """Maps an existing ring file.
+
+        Raises:
+            ValueError: the file is not a (fully initialized) frame ring.
+        """
+        self.path = path
+        with open(path, 'rb') as ring_file:
+            self._map = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < RING_HEADER_SIZE:
+            raise ValueError('{} is not a frame ring'.format(path))
+        (magic, self.num_slots, self.slot_size, _, _) = RING_HEADER.unpack_from(self._map)
+        if magic != RING_MAGIC or len(self._map) < RING_HEADER_SIZE + self.num_slots * self.slot_size:
+            raise ValueError('{} is not a frame ring'.format(path))
+        self.num_read = 0
+        self.frames_skipped = 0
+
+    def get_num_written(self):
+        """Returns the number of frames the writer has completed."""
+        return struct.unpack_from('<Q', self._map, _NUM_WRITTEN_OFFSET)[0]
+
+    def read_latest(self):
+        """Reads the newest completed frame, if it has not been read yet.
+
+        The frame is copied out of the ring between two reads of its slot's sequence number, and
+        read again if the writer touched the slot in between. A slot which stays mid-write, e.g.
+        because the writer stalled or crashed, is retried MAX_READ_ATTEMPTS times with a short
+        sleep before giving up until the next call.
+
+        Returns:
+            A Frame whose faces are a copy of the ring's data, or None if no new frame could be
+            read.
+        """
+        for attempt in range(MAX_READ_ATTEMPTS):
+            if attempt:
+                time.sleep(READ_RETRY_INTERVAL)
+            num_written = self.get_num_written()
+            if num_written == self.num_read:
+                return None
+            offset = RING_HEADER_SIZE + ((num_written - 1) % self.num_slots) * self.slot_size
+            (sequence,) = SLOT_HEADER.unpack_from(self._map, offset)
+            if sequence % 2:
+                continue  # the writer has already wrapped around to this slot
+            (magic, num_faces, values_per_face, _, frame_id, timestamp) = \
+                tracker_output.FRAME_HEADER.unpack_from(self._map, offset + SLOT_HEADER.size)
+            if magic != tracker_output.FRAME_MAGIC or _FRAME_OFFSET + 4 * num_faces * values_per_face > self.slot_size:
+                continue
+            faces = np.array(np.frombuffer(self._map, dtype='<f4', count=num_faces * values_per_face,
+                                           offset=offset + _FRAME_OFFSET))
+            if SLOT_HEADER.unpack_from(self._map, offset)[0] != sequence:
+                continue
+            self.frames_skipped += num_written - self.num_read - 1
+            self.num_read = num_written
+            return tracker_output.Frame(frame_id, timestamp, faces.reshape(num_faces, values_per_face))
+        return None
+
+    def close(self):
+        """Unmaps the ring."""
+        self._map.close()
+
+def open_reader(path, timeout=None, poll_interval=0.001, is_alive=None):
+    """Waits for a ring to be created at path, then maps it.
+
+    Arguments:
+        timeout: the maximum time to wait, in seconds, or None to wait indefinitely.
+        is_alive: if provided, a function which returns False when the writer has exited.
+    Returns:
+        A SharedFrameReader, or None if the wait timed out or the writer exited.
+    """
+    start_time = time.time()
+    while True:
+        try:
+            return SharedFrameReader(path)
+        except (IOError, OSError, ValueError):
+            pass
+        if ((timeout is not None and time.time() - start_time > timeout)
+                or (is_alive is not None and not is_alive())):
+            return None
+        time.sleep(poll_interval)
+
+def _run_stand_in_writer(transport, path, num_frames, interval):
+    """Writes num_frames frames of random landmarks, stamped with their write times."""
+    faces = np.random.uniform(0, 320, (1, 136))
+    if transport == 'shm':
+        writer = SharedFrameWriter(path)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    for frame_id in range(num_frames):
+        time.sleep(interval)
+        if transport == 'shm':
+            writer.write(frame_id, time.time(), faces)
+        else:
+            stdout.write(tracker_output.pack_frame(frame_id, time.time(), faces))
+            stdout.flush()
+    if transport == 'shm':
+        writer.close(unlink=False)
+
+def _benchmark(num_frames=500, interval=0.005, poll_interval=0.0):
+    """Measures per-frame latency from a stand-in writer process, over a pipe and over the ring."""
+    import subprocess
+    path = DEFAULT_PATH + '_benchmark'
+    for transport in ('pipe', 'shm'):
+        if os.path.exists(path):
+            os.unlink(path)
+        args = [sys.executable, __file__, transport, path, str(num_frames), str(interval)]
+        process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        latencies = []
+        if transport == 'pipe':
+            for frame in tracker_output.FrameReader(process.stdout):
+                latencies.append(time.time() - frame.timestamp)
+        else:
+            reader = open_reader(path, timeout=10)
+            while len(latencies) + reader.frames_skipped < num_frames:
+                frame = reader.read_latest()
+                if frame is None:
+                    time.sleep(poll_interval)
+                    continue
+                latencies.append(time.time() - frame.timestamp)
+        process.wait()
+        latencies = np.array(latencies) * 1e6
+        print '{}: {} frames, latency median {:.1f} us, 99th percentile {:.1f} us'.format(
+            transport, len(latencies), np.median(latencies), np.percentile(latencies, 99))
+    os.unlink(path)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        _run_stand_in_writer(sys.argv[1], sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        _benchmark()
@@ -0,0 +1,316 @@
+"""Solving for gaze from paired stereo keypoints, optionally in a separate worker process."""
+import time
+import multiprocessing
+import collections
+
+import numpy as np
+
+from utilities import signal_processing
+import stereo_cameras
+import stereo_util
+import transform_util
+
+# The options of the original gaze solve: 50 iterations of sequential RANSAC
+ORIGINAL_GAZE_OPTIONS = {'use_ransac': True, 'threshold': 2, 'num_iter': 50}
+# Vectorized, adaptive and warm-started RANSAC, which is faster than the original solve but draws
+# different samples, so its poses are not identical
+DEFAULT_GAZE_OPTIONS = dict(ORIGINAL_GAZE_OPTIONS, ransac_mode='vectorized', confidence=0.99, min_iter=4,
+                            warm_start_ratio=0.9)
+RESULT_SIZE = 1 + 2 + 9 + 3  # keypoints' timestamp, gaze point, rotation matrix, translation vector
+DEFAULT_STABILITY_THRESHOLD = 0.5  # px of mean keypoint motion between consecutive pairs
+
+GazeResult = collections.namedtuple('GazeResult', [
+    'sample', 'timestamp', 'gaze', 'target_px', 'rotation', 'translation'])
+
+def make_calibration(calibration_keypoints, **kwargs):
+    """Makes a calibration of the stereo camera rig, for a user looking at the center of the
+    screen with the paired keypoints calibration_keypoints.
+
+    Arguments:
+        kwargs: options for stereo_util.StereoModelCalibration.
+    """
+    camera_distance = float(-stereo_cameras.TRANSLATION[0])
+    camera_matrices = stereo_util.make_parallel_camera_matrices(
+        stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT, camera_distance)
+    return stereo_util.StereoModelCalibration(
+        camera_distance, stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT,
+        stereo_util.compute_3d_model(calibration_keypoints, camera_matrices),
+        initial_pos=np.array([camera_distance / 2.0,
+                              transform_util.CAMERA_Y + transform_util.MONITOR_HEIGHT / 2.0]),
+        **kwargs)
+
+class GazeSolver(object):
+    """Triangulates and filters keypoints, then solves for the head pose and gaze location."""
+    def __init__(self, calibration, points_3d_filters, gaze_options=DEFAULT_GAZE_OPTIONS):
+        """
+        Arguments:
+            calibration: a stereo_util.StereoModelCalibration
+            points_3d_filters: a filter bank over the triangulated N x 3 points
+            gaze_options: keyword arguments for calibration.compute_gaze_location
+        """
+        self.calibration = calibration
+        self.points_3d_filters = points_3d_filters
+        self.gaze_options = gaze_options
+
+    def solve(self, keypoints):
+        """Solves for the gaze location from an N x 2 x 2 array of paired keypoints.
+
+        Returns:
+            The gaze point, the rotation and the translation of the head.
+        Raises:
+            stereo_util.NoIntersectionException: the gaze does not intersect the screen.
+        """
+        points_3d = self.calibration.compute_3d_model(keypoints)
+        self.points_3d_filters.append(points_3d)
+        points_3d_filtered = self.points_3d_filters.estimate_current()
+        return self.calibration.compute_gaze_location(points_3d=points_3d_filtered, return_pose=True,
+                                                      **self.gaze_options)
+
+def get_ransac_options(gaze_options):
+    """Returns the keyword arguments of StereoModelCalibration.compute_RT_ransac which match
+    gaze_options, for solving for the head pose alone."""
+    options = dict(gaze_options)
+    options.pop('use_ransac', None)
+    if 'ransac_mode' in options:
+        options['mode'] = options.pop('ransac_mode')
+    return options
+
+def _shared_array(shape, typecode='d'):
+    """Returns a raw shared-memory array and a numpy view of it with the given shape."""
+    raw = multiprocessing.RawArray(typecode, int(np.prod(shape)))
+    return (raw, np.frombuffer(raw, dtype=np.dtype(typecode)).reshape(shape))
+
+class SolverProcess(object):
+    """Runs a GazeSolver in a worker process.
+
+    Keypoints are submitted into a shared-memory input buffer and results are published in
+    a shared-memory result buffer, each tagged with the sequence number and timestamp of its
+    keypoints.
+    The worker always solves the newest submission, skipping any it did not get to, and
+    results older than one already returned are never returned.
+    """
+    def __init__(self, solver, keypoints_shape, max_lag=None):
+        """
+        Arguments:
+            solver: a GazeSolver, which is moved into the worker process when it starts.
+            keypoints_shape: the shape of the submitted keypoints, e.g. (NUM_KEYPOINTS, 2, 2).
+            max_lag: if provided, results for keypoints more than this many submissions
+                older than the newest submission are dropped as stale.
+        """
+        self.solver = solver
+        self.max_lag = max_lag
+        self._condition = multiprocessing.Condition()
+        (self._raw_keypoints, self._keypoints) = _shared_array(keypoints_shape)
+        (self._raw_timestamp, self._timestamp) = _shared_array((1,))
+        (self._raw_result, self._result) = _shared_array((RESULT_SIZE,))
+        # submitted sequence, solved sequence, whether the solution intersects the screen, running
+        (self._raw_state, self._state) = _shared_array((4,), 'l')
+        self._process = None
+        self._returned_sequence = 0
+        self.results_dropped = 0
+
+    def start(self):
+        """Starts the worker process.
+
+        Threading:
+            Instantiates a singleton process named SolverProcess.
+        """
+        if self._process is not None:
+            return
+        self._state[3] = 1
+        self._process = multiprocessing.Process(target=self._run, name=self.__class__.__name__)
+        self._process.daemon = True
+        self._process.start()
+
+    def stop(self):
+        """Stops and joins the worker process."""
+        if self._process is None:
+            return
+        with self._condition:
+            self._state[3] = 0
+            self._condition.notify()
+        self._process.join()
+        self._process = None
+
+    def _run(self):
+        keypoints = np.empty_like(self._keypoints)
+        result = np.empty_like(self._result)
+        solved_sequence = 0
+        while True:
+            with self._condition:
+                while self._state[0] == solved_sequence and self._state[3]:
+                    self._condition.wait()
+                if not self._state[3]:
+                    return
+                keypoints[:] = self._keypoints
+                result[0] = self._timestamp[0]
+                solved_sequence = self._state[0]
+            try:
+                (gaze_point, rotation, translation) = self.solver.solve(keypoints)
+                result[1:3] = gaze_point
+                result[3:12] = np.ravel(rotation)
+                result[12:] = translation
+                intersects = 1
+            except stereo_util.NoIntersectionException:
+                intersects = 0
+            with self._condition:
+                self._result[:] = result
+                self._state[1] = solved_sequence
+                self._state[2] = intersects
+
+    def submit(self, keypoints, timestamp=np.nan):
+        """Submits paired keypoints captured at timestamp for solving, replacing any submission
+        not yet started.
+
+        Returns:
+            The sequence number of the submission.
+        """
+        with self._condition:
+            self._keypoints[:] = keypoints
+            self._timestamp[0] = timestamp
+            self._state[0] += 1
+            self._condition.notify()
+            return self._state[0]
+
+    def get_result(self):
+        """Takes the newest result, if one has been published since the last call.
+
+        Returns:
+            None if there is no new result, or else a tuple of the sequence number and timestamp of
+            the solved keypoints, the gaze point, the rotation and the translation of the head; the
+            last three are None if the gaze does not intersect the screen.
+        """
+        with self._condition:
+            (submitted_sequence, solved_sequence, intersects) = self._state[:3]
+            if solved_sequence <= self._returned_sequence:
+                return None
+            result = self._result.copy()
+        self._returned_sequence = solved_sequence
+        if self.max_lag is not None and submitted_sequence - solved_sequence > self.max_lag:
+            self.results_dropped += 1
+            return None
+        if not intersects:
+            return (solved_sequence, result[0], None, None, None)
+        return (solved_sequence, result[0], result[1:3], result[3:12].reshape(3, 3), result[12:])
+
+class GazeCursor(object):
+    """Calibrates to a user looking at the center of the screen, then moves a cursor to where
+    they look, from pairs of stereo keypoints.
+
+    The cursor starts 'ready'. While 'calibrating', the newest keypoints are kept as the
+    calibration keypoints; while 'stabilizing', each update solves for the gaze location and
+    filters it into a cursor position in render pixels.
+    """
+    def __init__(self, gaze_options=DEFAULT_GAZE_OPTIONS, use_solver_process=False, stable_frames=None,
+                 stability_threshold=DEFAULT_STABILITY_THRESHOLD):
+        """
+        Arguments:
+            gaze_options: keyword arguments for StereoModelCalibration.compute_gaze_location,
+                e.g. ORIGINAL_GAZE_OPTIONS for the original sequential RANSAC.
+            use_solver_process: whether to solve for the gaze location in a SolverProcess. Each
+                update then uses the newest result available, which lags by about a frame.
+            stable_frames: if provided, calibration finishes by itself once this many
+                consecutive pairs of keypoints have each moved less than stability_threshold
+                pixels on average from the previous pair.
+        """
+        self.gaze_options = gaze_options
+        self.use_solver_process = use_solver_process
+        self.stable_frames = stable_frames
+        self.stability_threshold = stability_threshold
+        self.state = 'ready'
+        self.calibration_keypoints = None
+        self.calibration = None
+        self.points_3d_filters = None
+        self.target_filters = signal_processing.ThresholdKalmanFilterBank((2,), position_from_stationary=10, velocity_from_stationary=100, acceleration_from_stationary=200,
+                                                                          velocity_to_stationary=200, acceleration_to_stationary=300)
+        self.results_produced = 0
+        self._num_stable_frames = 0
+        self._gaze_solver = None
+        self._solver_process = None
+
+    def start_calibrating(self):
+        self.state = 'calibrating'
+        self.calibration_keypoints = None
+        self._num_stable_frames = 0
+
+    def start_responding(self):
+        """Finishes calibrating with the newest keypoints, and starts solving for the gaze."""
+        if self.calibration_keypoints is None:
+            raise ValueError('No keypoints have been received to calibrate with')
+        self.state = 'stabilizing'
+        self.calibration = make_calibration(self.calibration_keypoints)
+        self.points_3d_filters = signal_processing.FilterBank((len(self.calibration_keypoints), 3), 20,
+                                                              estimation_mode='mean')
+        self._gaze_solver = GazeSolver(self.calibration, self.points_3d_filters, self.gaze_options)
+        if self.use_solver_process:
+            self._solver_process = SolverProcess(self._gaze_solver, self.calibration_keypoints.shape)
+            self._solver_process.start()
+
+    def stop(self):
+        """Stops the solver process, if any."""
+        if self._solver_process is not None:
+            self._solver_process.stop()
+            self._solver_process = None
+
+    def update_calibration(self, keypoints):
+        """Keeps keypoints as the calibration keypoints, and finishes calibrating if they have
+        been stable for stable_frames pairs."""
+        if self.calibration_keypoints is not None:
+            motion = np.mean(np.linalg.norm(keypoints - self.calibration_keypoints, axis=-1))
+            if motion < self.stability_threshold:
+                self._num_stable_frames += 1
+            else:
+                self._num_stable_frames = 0
+        self.calibration_keypoints = np.array(keypoints, copy=True)
+        if self.stable_frames is not None and self._num_stable_frames >= self.stable_frames:
+            self.start_responding()
+
+    def solve_gaze(self, keypoints, timestamp):
+        """Solves for the gaze from keypoints captured at timestamp. In a SolverProcess, the
+        solution may be for earlier keypoints.
+
+        Returns:
+            The timestamp of the solved keypoints, the gaze point, the rotation and the
+            translation, or None if there is no gaze location (yet).
+        """
+        if self._solver_process is not None:
+            self._solver_process.submit(keypoints, timestamp)
+            result = self._solver_process.get_result()
+            return None if result is None or result[2] is None else result[1:]
+        try:
+            return (timestamp,) + tuple(self._gaze_solver.solve(keypoints))
+        except stereo_util.NoIntersectionException:
+            return None
+
+    def filter_target(self, gaze, timestamp=None):
+        """Filters a gaze point into a cursor position in render pixels, or None if the filters
+        have no estimate."""
+        target_px = transform_util.screen_xy_to_render_xy(*gaze)
+        target_px = -2 * np.array([target_px[0], target_px[1]])
+        self.target_filters.append(target_px, timestamp)
+        target_px = self.target_filters.estimate_current()
+        if np.any(np.isnan(target_px)):
+            return None
+        return target_px
+
+    def update(self, keypoints, timestamp=None):
+        """Updates the cursor from N x 2 x 2 paired keypoints captured at timestamp (the current
+        time if None).
+
+        Returns:
+            A GazeResult while stabilizing, if the gaze location was found, or else None. With a
+            SolverProcess, the result and its timestamp may be for earlier keypoints.
+        """
+        if self.state == 'calibrating':
+            self.update_calibration(keypoints)
+            return None
+        if self.state != 'stabilizing':
+            return None
+        solution = self.solve_gaze(keypoints, time.time() if timestamp is None else timestamp)
+        if solution is None:
+            return None
+        (timestamp, gaze, rotation, translation) = solution
+        result = GazeResult(self.results_produced, timestamp, gaze, self.filter_target(gaze, timestamp),
+                            rotation, translation)
+        self.results_produced += 1
+        return result
@@ -0,0 +1,200 @@
+"""Synchronization of samples from the left and right trackers of the stereo camera rig."""
+import time
+import threading
+
+import numpy as np
+
+from utilities import util
+
+DEFAULT_MAX_SKEW = 0.02  # s; half the frame period of a 25 fps camera
+DEFAULT_SKEW_BIN_EDGES = np.linspace(0, DEFAULT_MAX_SKEW, 11)
+
+class StereoSynchronizer(object):
+    """Hands over pairs of left and right samples to a consumer thread.
+
+    Tracker threads put samples for each side; the consumer blocks until both sides have
+    a sample it has not consumed yet, then receives the newest pair. Samples are copied
+    when they are put, so trackers may keep overwriting their own buffers. The capture time
+    of the later sample of the last pair taken is kept in pair_timestamp.
+    """
+    def __init__(self, statistics_window_size=100):
+        self._condition = threading.Condition()
+        self._samples = [None, None]
+        self._timestamps = [None, None]
+        self._fresh = [False, False]
+        self._closed = False
+        self.pairs_delivered = 0
+        self.samples_superseded = [0, 0]
+        self.wait_times = util.RingBuffer(statistics_window_size, dtype='d')
+        self.pair_timestamp = None
+
+    def _put(self, side, sample, timestamp):
+        sample = np.array(sample, copy=True)
+        if timestamp is None:
+            timestamp = time.time()
+        with self._condition:
+            if self._fresh[side]:
+                self.samples_superseded[side] += 1
+            self._samples[side] = sample
+            self._timestamps[side] = timestamp
+            self._fresh[side] = True
+            if self._fresh[1 - side]:
+                self._condition.notify()
+
+    def put_left(self, sample, timestamp=None):
+        """Puts a sample from the left camera, captured at timestamp (or now, if None)."""
+        self._put(0, sample, timestamp)
+
+    def put_right(self, sample, timestamp=None):
+        """Puts a sample from the right camera, captured at timestamp (or now, if None)."""
+        self._put(1, sample, timestamp)
+
+    def _is_pair_ready(self):
+        return self._fresh[0] and self._fresh[1]
+
+    def _take_pair(self):
+        self._fresh = [False, False]
+        self.pair_timestamp = max(self._timestamps)
+        return tuple(self._samples)
+
+    def get_pair(self, timeout=None):
+        """Waits until both sides are fresh and takes the newest pair.
+
+        Arguments:
+            timeout: the maximum time to wait, in seconds, or None to wait indefinitely (which
+                under Python 2 wakes up sooner than a timed wait, as that polls the lock).
+        Returns:
+            A tuple of the left and right samples, or None if the wait timed out or the
+            synchronizer was closed.
+        """
+        start_time = time.time()
+        with self._condition:
+            while not self._is_pair_ready():
+                if self._closed:
+                    return None
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = timeout - (time.time() - start_time)
+                    if remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
+            pair = self._take_pair()
+            self.pairs_delivered += 1
+            self.wait_times.append(time.time() - start_time)
+        return pair
+
+    def close(self):
+        """Wakes up and returns None to any consumer waiting for a pair."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get_wait_statistics(self):
+        """Returns statistics of the times the consumer recently waited for pairs, in seconds."""
+        with self._condition:
+            wait_times = np.array(self.wait_times.get_continuous())
+        if not wait_times.size:
+            return None
+        return {
+            'pairs': self.pairs_delivered,
+            'mean': np.mean(wait_times),
+            'median': np.median(wait_times),
+            'max': np.max(wait_times),
+        }
+
+class TimestampedStereoSynchronizer(StereoSynchronizer):
+    """Hands over pairs of left and right samples matched by capture time.
+
+    Each side keeps a small buffer of its newest timestamped samples. When a sample arrives,
+    it is matched with the unpaired sample from the other side nearest to it in time; if they
+    are at most max_skew apart, they become the newest pair. Unpaired samples older than a
+    pair are discarded, as are samples which age out of the buffers.
+    """
+    def __init__(self, max_skew=DEFAULT_MAX_SKEW, buffer_length=8, statistics_window_size=100,
+                 skew_bin_edges=DEFAULT_SKEW_BIN_EDGES):
+        super(TimestampedStereoSynchronizer, self).__init__(statistics_window_size)
+        self.max_skew = max_skew
+        self.buffer_length = buffer_length
+        self._buffers = [None, None]
+        self._paired_timestamps = [-np.inf, -np.inf]
+        self._pair = None
+        self._pair_capture_timestamp = None
+        self.frames_received = [0, 0]
+        self.pairs_matched = 0
+        self.skews = util.RingBuffer(statistics_window_size, dtype='d')
+        self.skew_bin_edges = np.asarray(skew_bin_edges)
+        self.skew_histogram = np.zeros(len(self.skew_bin_edges) - 1, dtype=int)
+
+    def _put(self, side, sample, timestamp):
+        if timestamp is None:
+            timestamp = time.time()
+        sample = np.asarray(sample)
+        with self._condition:
+            self.frames_received[side] += 1
+            buffer = self._buffers[side]
+            if buffer is None:
+                buffer = util.TimestampedRingBuffer(self.buffer_length, sample.shape, sample.dtype)
+                self._buffers[side] = buffer
+            elif timestamp < buffer.get_head()['timestamp']:
+                return  # out of order, so it can't be looked up in the buffer
+            buffer.append(sample, timestamp)
+
+            other_buffer = self._buffers[1 - side]
+            if other_buffer is None:
+                return
+            candidates = other_buffer.get_range(np.nextafter(self._paired_timestamps[1 - side], np.inf), np.inf)
+            if not len(candidates):
+                return
+            skews = candidates['timestamp'] - timestamp
+            nearest = np.argmin(np.abs(skews))
+            if abs(skews[nearest]) > self.max_skew:
+                return
+            pair = [None, None]
+            pair[side] = np.array(sample, copy=True)
+            pair[1 - side] = np.array(candidates['values'][nearest], copy=True)
+            self._paired_timestamps[side] = timestamp
+            self._paired_timestamps[1 - side] = candidates['timestamp'][nearest]
+            if self._pair is not None:
+                self.samples_superseded[0] += 1
+                self.samples_superseded[1] += 1
+            self._pair = tuple(pair)
+            self._pair_capture_timestamp = max(timestamp, candidates['timestamp'][nearest])
+            self.pairs_matched += 1
+
+            skew = abs(skews[nearest])
+            self.skews.append(skew)
+            bin_index = np.searchsorted(self.skew_bin_edges, skew, side='right') - 1
+            self.skew_histogram[min(max(bin_index, 0), len(self.skew_histogram) - 1)] += 1
+            self._condition.notify()
+
+    def _is_pair_ready(self):
+        return self._pair is not None
+
+    def _take_pair(self):
+        pair = self._pair
+        self._pair = None
+        self.pair_timestamp = self._pair_capture_timestamp
+        return pair
+
+    def get_frames_discarded(self):
+        """Returns the numbers of left and right samples which were never paired."""
+        with self._condition:
+            return [received - self.pairs_matched for received in self.frames_received]
+
+    def get_skew_statistics(self):
+        """Returns statistics of the skews between recently paired samples, in seconds, and the
+        histogram of the skews of all pairs over skew_bin_edges."""
+        with self._condition:
+            skews = np.array(self.skews.get_continuous())
+            histogram = self.skew_histogram.copy()
+        if not skews.size:
+            return None
+        return {
+            'pairs': self.pairs_matched,
+            'mean': np.mean(skews),
+            'median': np.median(skews),
+            'max': np.max(skews),
+            'histogram': histogram,
+            'bin_edges': self.skew_bin_edges,
+        }
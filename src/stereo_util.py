@@ -36,19 +36,177 @@ def jacobian(point_3d, camera_matrices):
     jacobian = np.concatenate(jacobian, axis=0)
     return jacobian
 
-def nonlinear_estimate_3d_point(image_points, camera_matrices):
-    num_iters = 0
-    P_hat = linear_estimate_3d_point(image_points, camera_matrices)
-    for iter_num in xrange(num_iters):
-        J = jacobian(P_hat, camera_matrices)
-        e = reprojection_error(P_hat, image_points, camera_matrices)
-        P_hat -= np.linalg.inv(J.T.dot(J)).dot(J.T).dot(e)
-    return P_hat
+def nonlinear_estimate_3d_point(image_points, camera_matrices, num_iters=0, tolerance=1e-6):
+    return nonlinear_estimate_3d_points(np.asarray(image_points)[None], camera_matrices,
+                                        num_iters=num_iters, tolerance=tolerance)[0]
 """
 END FUNCTIONS TAKEN FROM ASSIGNMENT 2
 """
 
-def compute_3d_model(points, camera_matrices):
+def linear_estimate_3d_points(points, camera_matrices, out=None):
+  """
+  Batched version of linear_estimate_3d_point, which triangulates all paired observations with
+  a single stacked SVD instead of one SVD per point.
+
+  Arguments:
+    points: a N x C x 2 set of points corresponding to positions on images taken by the C cameras.
+      second to last index corresponds to camera number.
+    camera_matrices: a C x 3 x 4 matrix containing the camera matrices
+    out: an optional preallocated N x 3 array in which to store the triangulated points
+
+  Returns:
+    points_3d: a N x 3 matrix of the triangulated points
+  """
+  points = np.asarray(points, dtype=np.float64)
+  camera_matrices = np.asarray(camera_matrices, dtype=np.float64)
+  num_points = points.shape[0]
+  num_cameras = camera_matrices.shape[0]
+  if out is None:
+    out = np.empty((num_points, 3))
+  if num_points == 0:
+    return out
+  # Rows 2k and 2k + 1 of each system are x_k * M_k[2] - M_k[0] and y_k * M_k[2] - M_k[1]
+  A = (points[:, :, :, None] * camera_matrices[None, :, 2:3, :]
+       - camera_matrices[None, :, 0:2, :])
+  A = A.reshape(num_points, 2 * num_cameras, 4)
+  U, S, V = np.linalg.svd(A)
+  P = V[:, -1, :]
+  np.divide(P[:, :-1], P[:, -1:], out=out)
+  return out
+
+def reprojection_errors(points_3d, points, camera_matrices):
+  """
+  Batched version of reprojection_error.
+
+  Arguments:
+    points_3d: a N x 3 set of 3d points
+    points: a N x C x 2 set of observed points on images taken by the C cameras
+    camera_matrices: a C x 3 x 4 matrix containing the camera matrices
+
+  Returns:
+    errors: a N x 2C matrix of the reprojection errors, ordered as in reprojection_error
+  """
+  projected = np.einsum('cij,nj->nci', camera_matrices[:, :, :3], points_3d) + camera_matrices[:, :, 3]
+  errors = projected[:, :, :2] / projected[:, :, 2:] - points
+  return errors.reshape(points_3d.shape[0], -1)
+
+def jacobians(points_3d, camera_matrices):
+  """
+  Batched version of jacobian.
+
+  Arguments:
+    points_3d: a N x 3 set of 3d points
+    camera_matrices: a C x 3 x 4 matrix containing the camera matrices
+
+  Returns:
+    jacobians: a N x 2C x 3 stack of the jacobians of the reprojections of each point
+  """
+  projected = np.einsum('cij,nj->nci', camera_matrices[:, :, :3], points_3d) + camera_matrices[:, :, 3]
+  depths = projected[:, :, 2:3, None]
+  J = (depths * camera_matrices[None, :, 0:2, :3]
+       - projected[:, :, 0:2, None] * camera_matrices[None, :, 2:3, :3]) / depths ** 2
+  return J.reshape(points_3d.shape[0], -1, 3)
+
+def nonlinear_estimate_3d_points(points, camera_matrices, num_iters=10, tolerance=1e-6,
+                                 initial_points_3d=None, out=None):
+  """
+  Batched version of nonlinear_estimate_3d_point, which refines all triangulated points
+  together with Gauss-Newton iterations that minimize their reprojection errors.
+
+  Arguments:
+    points: a N x C x 2 set of points corresponding to positions on images taken by the C cameras.
+      second to last index corresponds to camera number.
+    camera_matrices: a C x 3 x 4 matrix containing the camera matrices
+    num_iters: the maximum number of Gauss-Newton iterations to run
+    tolerance: refinement stops early once the RMS reprojection error (in pixels) changes by
+      less than this amount between iterations
+    initial_points_3d: an optional N x 3 initial estimate of the points. If None, the points are
+      initialized with linear_estimate_3d_points.
+    out: an optional preallocated N x 3 array in which to store the refined points
+
+  Returns:
+    points_3d: a N x 3 matrix of the triangulated points
+  """
+  points = np.asarray(points, dtype=np.float64)
+  camera_matrices = np.asarray(camera_matrices, dtype=np.float64)
+  if initial_points_3d is None:
+    P_hat = linear_estimate_3d_points(points, camera_matrices, out=out)
+  elif out is None:
+    P_hat = np.array(initial_points_3d, dtype=np.float64)
+  else:
+    P_hat = out
+    P_hat[:] = initial_points_3d
+  if P_hat.shape[0] == 0:
+    return P_hat
+  prev_rms_error = None
+  for iter_num in xrange(num_iters):
+    e = reprojection_errors(P_hat, points, camera_matrices)
+    rms_error = np.sqrt(np.mean(e ** 2))
+    if prev_rms_error is not None and abs(prev_rms_error - rms_error) < tolerance:
+      break
+    prev_rms_error = rms_error
+    J = jacobians(P_hat, camera_matrices)
+    JtJ = np.einsum('nki,nkj->nij', J, J)
+    Jte = np.einsum('nki,nk->ni', J, e)
+    P_hat -= np.linalg.solve(JtJ, Jte[:, :, None])[:, :, 0]
+  return P_hat
+
+def make_disp_to_depth_matrix(camera_matrices):
+  """
+  Make the 4 x 4 disparity-to-depth matrix (Q) for a pair of parallel cameras, such as those
+  from make_parallel_camera_matrices. This follows the convention of OpenCV's stereoRectify,
+  so Q.dot([x, y, x - x', 1]) gives the homogeneous 3d point seen at (x, y) in the first image
+  and at x' in the second image.
+
+  Arguments:
+    camera_matrices: a 2 x 3 x 4 matrix containing the camera matrices M1 and M2 of parallel
+      cameras, where M2 only differs from M1 by a translation along the x axis
+
+  Returns:
+    disp_to_depth_mat: a 4 x 4 matrix mapping (x, y, disparity, 1) to homogeneous 3d points
+  """
+  M1, M2 = camera_matrices
+  (fx, fy, cx, cy) = (M1[0,0], M1[1,1], M1[0,2], M1[1,2])
+  # M2[0,3] is fx * Tx, where Tx is the x coordinate of camera 1 in the frame of camera 2
+  Tx = M2[0,3] / fx
+  return np.array([[1, 0, 0, -cx],
+    [0, fx / fy, 0, -cy * fx / fy],
+    [0, 0, 0, fx],
+    [0, 0, -1. / Tx, (cx - M2[0,2]) / Tx]])
+
+def disparity_estimate_3d_points(points, disp_to_depth_mat, out=None):
+  """
+  Triangulate rectified paired observations in closed form from their x-disparity.
+
+  This is only exact for rectified, row-aligned observations, where each point has the same y
+  in both images. Keypoints from the trackers are not rectified, so this mode is only an
+  approximation for them.
+
+  Arguments:
+    points: a N x 2 x 2 set of rectified points corresponding to positions on images taken by
+      the two cameras. second to last index corresponds to camera number.
+    disp_to_depth_mat: the 4 x 4 disparity-to-depth matrix (Q) in the frame of the camera
+      matrices, as from make_disp_to_depth_matrix. calib/disp_to_depth_mat.npy from OpenCV's
+      stereoRectify uses a different frame and scale, so it cannot be used here.
+    out: an optional preallocated N x 3 array in which to store the triangulated points
+
+  Returns:
+    points_3d: a N x 3 matrix of the triangulated points
+  """
+  points = np.asarray(points, dtype=np.float64)
+  Q = np.asarray(disp_to_depth_mat, dtype=np.float64)
+  if out is None:
+    out = np.empty((points.shape[0], 3))
+  disparities = points[:, 0, 0] - points[:, 1, 0]
+  homogeneous = (np.outer(points[:, 0, 0], Q[:, 0]) + np.outer(points[:, 0, 1], Q[:, 1])
+                 + np.outer(disparities, Q[:, 2]) + Q[:, 3])
+  np.divide(homogeneous[:, :3], homogeneous[:, 3:], out=out)
+  return out
+
+TRIANGULATION_MODES = ('svd', 'disparity')
+
+def compute_3d_model(points, camera_matrices, out=None, mode='svd', disp_to_depth_mat=None,
+                     num_iters=0, tolerance=1e-6):
   """
   Compute the set of 3d points corresponding to the paired observations.
 
@@ -56,15 +214,29 @@ def compute_3d_model(points, camera_matrices):
     points: a N x 2 x 2 set of points corresponding to positions on images taken by the two cameras.
       second to last index corresponds to camera number.
     camera_matrices: a 2 x 3 x 4 matrix containing the camera matrices M1 and M2
+    out: an optional preallocated N x 3 array in which to store the triangulated points
+    mode: 'svd' for general linear triangulation, or 'disparity' for closed-form triangulation
+      of rectified, row-aligned points from their x-disparity
+    disp_to_depth_mat: the 4 x 4 disparity-to-depth matrix to use in 'disparity' mode. If None,
+      it is derived from camera_matrices, which must then be parallel.
+    num_iters: the maximum number of Gauss-Newton iterations used to refine the triangulated
+      points by minimizing their reprojection errors. 0 disables refinement.
+    tolerance: refinement stops early once the RMS reprojection error changes by less than this
 
   Returns:
     points_3d: a N x 3 matrix of the triangulated points
   """
-  points_3d = []
-  for point_pair in points:
-    point_3d = nonlinear_estimate_3d_point(point_pair, camera_matrices)
-    points_3d.append(point_3d)
-  points_3d = np.array(points_3d)
+  if mode == 'svd':
+    points_3d = linear_estimate_3d_points(points, camera_matrices, out=out)
+  elif mode == 'disparity':
+    if disp_to_depth_mat is None:
+      disp_to_depth_mat = make_disp_to_depth_matrix(camera_matrices)
+    points_3d = disparity_estimate_3d_points(points, disp_to_depth_mat, out=out)
+  else:
+    raise ValueError('Unknown triangulation mode: {}'.format(mode))
+  if num_iters > 0:
+    nonlinear_estimate_3d_points(points, camera_matrices, num_iters=num_iters, tolerance=tolerance,
+                                 initial_points_3d=points_3d, out=points_3d)
   return points_3d
 
 # Calculates rotation matrix to euler angles
@@ -142,11 +314,60 @@ def apply_transformation(model_3d, R, T):
   final = rotated + np.mean(model_3d, axis=0) + T
   return final
 
+def adaptive_ransac_iterations(inlier_ratio, confidence, min_iter, max_iter, sample_size=4):
+  """
+  Compute the number of RANSAC iterations needed to draw at least one sample of sample_size
+  inliers with probability confidence, clamped between min_iter and max_iter.
+  """
+  all_inlier_probability = inlier_ratio ** sample_size
+  if all_inlier_probability >= 1:
+    required_iter = 0
+  elif all_inlier_probability <= 0:
+    required_iter = max_iter
+  else:
+    required_iter = int(np.ceil(np.log(1 - confidence) / np.log(1 - all_inlier_probability)))
+  return int(max(min_iter, min(required_iter, max_iter)))
+
+def sample_ransac_indices(num_points, num_samples, sample_size=4):
+  """
+  Draw num_samples minimal samples of sample_size distinct indices each out of num_points, as a
+  num_samples x sample_size matrix.
+  """
+  return np.argpartition(np.random.rand(num_samples, num_points), sample_size - 1,
+                         axis=1)[:, :sample_size]
+
+def score_ransac_hypotheses(points_3d, model_centered, centroid_mod, indices):
+  """
+  Fit one rigid transformation hypothesis per minimal sample with a batched Kabsch SVD and
+  measure how far every observed point is from each transformed model.
+
+  Arguments:
+    points_3d: a N x 3 set of observed points
+    model_centered: a N x 3 set of model points, centered at the model centroid
+    centroid_mod: the centroid of the model
+    indices: a K x S matrix of the indices of the K minimal samples
+
+  Returns:
+    distances: a K x N matrix of the distances between the observed points and the model points
+      transformed by each hypothesis
+  """
+  sampled_points = points_3d[indices]
+  sampled_model = model_centered[indices]
+  centroids_ob = np.mean(sampled_points, axis=1)
+  H = np.einsum('ksi,ksj->kij', sampled_points - centroids_ob[:, None, :], sampled_model)
+  U, s, V = np.linalg.svd(H)
+  R = np.matmul(U, V)
+  T = centroids_ob - np.einsum('kj,kij->ki', np.mean(sampled_model, axis=1), R) - centroid_mod
+  transformed_model = np.einsum('nj,kij->kni', model_centered, R) + (centroid_mod + T)[:, None, :]
+  return np.linalg.norm(transformed_model - points_3d, ord=2, axis=2)
+
 class NoIntersectionException(Exception):
   pass
 
 class StereoModelCalibration:
-  def __init__(self, camera_distance, K1, K2, model_3d=None, initial_pos=None):
+  def __init__(self, camera_distance, K1, K2, model_3d=None, initial_pos=None,
+               triangulation_mode='svd', disp_to_depth_mat=None, refinement_iters=0,
+               refinement_tolerance=1e-6):
     """
     Initialize the stereo model calibration. Requires two cameras with known camera matrices
     at the same height and parallel to one another.
@@ -160,6 +381,16 @@ class StereoModelCalibration:
         reference position
       initial_pos: position on the screen (in same units as camera matrices) that the user is
         initially looking at. measured relative to the camera position.
+      triangulation_mode: the mode used by compute_3d_model to triangulate observations. use
+        'disparity' for the closed-form fast path only when observations are rectified and
+        row-aligned.
+      disp_to_depth_mat: the disparity-to-depth matrix for 'disparity' mode, in the frame of
+        the parallel camera matrices. if None, it is derived from them with
+        make_disp_to_depth_matrix.
+      refinement_iters: the maximum number of Gauss-Newton iterations used by compute_3d_model
+        to refine triangulated points. 0 disables refinement.
+      refinement_tolerance: the change in RMS reprojection error (in pixels) below which
+        refinement stops early
 
     We assume that moving rightward from the camera's point of view is +x, moving downward is +y,
     and moving away form the camera is +z.
@@ -167,6 +398,24 @@ class StereoModelCalibration:
     self._camera_matrices = make_parallel_camera_matrices(K1, K2, camera_distance)
     self._model_3d = model_3d
     self._initial_pos = initial_pos
+    self.triangulation_mode = triangulation_mode
+    if disp_to_depth_mat is None:
+      disp_to_depth_mat = make_disp_to_depth_matrix(self._camera_matrices)
+    self._disp_to_depth_mat = disp_to_depth_mat
+    self.refinement_iters = refinement_iters
+    self.refinement_tolerance = refinement_tolerance
+    self.ransac_iterations = 0
+    self.warm_started = False
+    self._previous_RT = None
+
+  def compute_3d_model(self, points, out=None):
+    """
+    Triangulate a N x 2 x 2 set of paired observations with this calibration's cameras and
+    triangulation mode.
+    """
+    return compute_3d_model(points, self._camera_matrices, out=out, mode=self.triangulation_mode,
+                            disp_to_depth_mat=self._disp_to_depth_mat,
+                            num_iters=self.refinement_iters, tolerance=self.refinement_tolerance)
 
   def compute_RT(self, points=None, points_3d=None):
     """
@@ -184,7 +433,7 @@ class StereoModelCalibration:
         position)
     """
     if points_3d is None:
-      points_3d = compute_3d_model(points, self._camera_matrices)
+      points_3d = self.compute_3d_model(points)
     centroid_ob = np.mean(points_3d, axis=0)
     centroid = np.mean(self._model_3d, axis=0)
     H = (points_3d - centroid_ob).T.dot(self._model_3d - centroid)
@@ -193,7 +442,8 @@ class StereoModelCalibration:
     T = centroid_ob - centroid
     return R.T, T
 
-  def compute_RT_ransac(self, threshold=1, num_iter=100, points=None, points_3d=None):
+  def compute_RT_ransac(self, threshold=1, num_iter=100, points=None, points_3d=None, mode='sequential',
+                        confidence=None, min_iter=1, warm_start_ratio=None):
     """
     Compute the RT matrix that, when applied to the original 3d model, yields the set of
     observations in points.
@@ -202,35 +452,90 @@ class StereoModelCalibration:
       points: a N x 2 x 2 set of points corresponding to positions on images taken by the two cameras.
         second to last index corresponds to camera number.
       threshold: the maximum permissible distance error in centimeters
-      num_iter: the number of iterations to run RANSAC
+      num_iter: the number of iterations to run RANSAC. in adaptive mode, the maximum number.
+      mode: 'sequential' to fit and score one hypothesis per iteration, or 'vectorized' to fit
+        and score all num_iter hypotheses at once with batched array operations
+      confidence: if provided, RANSAC is adaptive and stops as soon as it has run enough
+        iterations to have drawn an all-inlier sample with this probability, given the best
+        inlier ratio found so far
+      min_iter: the minimum number of iterations to run RANSAC in adaptive mode
+      warm_start_ratio: if provided, the pose from the previous call is scored first, and if at
+        least this fraction of the points are its inliers, the random search is skipped and the
+        pose is refitted to those inliers
 
     Returns:
       R: the rotation matrix (to be applied about the centroid of the object) that changes the 3d
         model to the observed points
       T: the translation vector (displacement of centroid from calibrated position to final
         position)
+      inliers: the indices of the points within threshold of the best hypothesis
+
+    The number of iterations actually run is stored in ransac_iterations, and whether the
+    previous pose was reused is stored in warm_started.
     """
     if points_3d is None:
-      points_3d = compute_3d_model(points, self._camera_matrices)
+      points_3d = self.compute_3d_model(points)
 
     N = points_3d.shape[0]
     inliers = np.array([])
     centroid_mod = np.mean(self._model_3d, axis=0)
     model_centered = self._model_3d - centroid_mod
-    for i in xrange(num_iter):
-      indices = np.random.choice(N, size=4, replace=False)
-      centroid_ob = np.mean(points_3d[indices,:], axis=0)
-      points_centered = points_3d[indices,:] - centroid_ob
-      H = points_centered.T.dot(model_centered[indices,:])
-      U, s, V = np.linalg.svd(H)
-      R = V.T.dot(U.T).T
-      transformed_model = model_centered.dot(R.T) + centroid_mod
-      T = np.mean(points_3d[indices,:] - transformed_model[indices,:], axis=0)
-      transformed_model += T
+    if confidence is None:
+      required_iter = num_iter
+    else:
+      required_iter = min(max(min_iter, 1), num_iter)
+    iteration = 0
+    self.warm_started = False
+    if warm_start_ratio is not None and self._previous_RT is not None:
+      (R, T) = self._previous_RT
+      transformed_model = model_centered.dot(R.T) + centroid_mod + T
       distances = np.linalg.norm(transformed_model - points_3d, ord=2, axis=1)
-      new_inliers = np.nonzero(distances <= threshold)[0]
-      if len(new_inliers) > len(inliers):
-        inliers = new_inliers
+      previous_inliers = np.nonzero(distances <= threshold)[0]
+      if len(previous_inliers) > 0 and len(previous_inliers) >= warm_start_ratio * N:
+        inliers = previous_inliers
+        required_iter = 0
+        self.warm_started = True
+    if mode == 'sequential':
+      while iteration < required_iter:
+        indices = np.random.choice(N, size=4, replace=False)
+        centroid_ob = np.mean(points_3d[indices,:], axis=0)
+        points_centered = points_3d[indices,:] - centroid_ob
+        H = points_centered.T.dot(model_centered[indices,:])
+        U, s, V = np.linalg.svd(H)
+        R = V.T.dot(U.T).T
+        transformed_model = model_centered.dot(R.T) + centroid_mod
+        T = np.mean(points_3d[indices,:] - transformed_model[indices,:], axis=0)
+        transformed_model += T
+        distances = np.linalg.norm(transformed_model - points_3d, ord=2, axis=1)
+        new_inliers = np.nonzero(distances <= threshold)[0]
+        iteration += 1
+        if len(new_inliers) > len(inliers):
+          inliers = new_inliers
+          if confidence is not None:
+            required_iter = adaptive_ransac_iterations(
+              float(len(inliers)) / N, confidence, min_iter, num_iter)
+        if not len(inliers) and iteration == required_iter:
+          # Adaptive RANSAC cannot stop before any hypothesis has inliers
+          required_iter = num_iter
+    elif mode == 'vectorized':
+      # In adaptive mode, hypotheses are drawn in batches of the remaining required iterations
+      while iteration < required_iter:
+        distances = score_ransac_hypotheses(points_3d, model_centered, centroid_mod,
+                                            sample_ransac_indices(N, required_iter - iteration))
+        iteration = required_iter
+        num_inliers = np.count_nonzero(distances <= threshold, axis=1)
+        best = np.argmax(num_inliers)
+        if num_inliers[best] > len(inliers):
+          inliers = np.nonzero(distances[best] <= threshold)[0]
+          if confidence is not None:
+            required_iter = adaptive_ransac_iterations(
+              float(len(inliers)) / N, confidence, min_iter, num_iter)
+        if not len(inliers):
+          # Adaptive RANSAC cannot stop before any hypothesis has inliers
+          required_iter = num_iter
+    else:
+      raise ValueError('Unknown RANSAC mode: {}'.format(mode))
+    self.ransac_iterations = iteration
 
     # centroid_ob = np.mean(points_3d[inliers,:], axis=0)
     # centroid = np.mean(self._model_3d[inliers,:], axis=0)
@@ -247,9 +552,16 @@ class StereoModelCalibration:
     R = V.T.dot(U.T)
     transformed_model = model_centered.dot(R) + centroid_mod
     T = np.mean(points_3d[inliers,:] - transformed_model[inliers,:], axis=0)
+    self._previous_RT = (R.T, T)
     return R.T, T, inliers
 
-  def compute_gaze_location(self, points=None, points_3d=None, use_ransac=False, threshold=1, num_iter=100):
+  def reset_warm_start(self):
+    """Forget the previous pose, so that the next warm-started RANSAC runs the full search."""
+    self._previous_RT = None
+
+  def compute_gaze_location(self, points=None, points_3d=None, use_ransac=False, threshold=1, num_iter=100,
+                            ransac_mode='sequential', confidence=None, min_iter=1, warm_start_ratio=None,
+                            return_pose=False):
     """
     Compute the location that a user is looking at given a set of keypoints.
 
@@ -259,17 +571,29 @@ class StereoModelCalibration:
       use_ransac: whether or not to use RANSAC
       threshold: the maximum permissible distance error in centimeters (RANSAC only)
       num_iter: the number of iterations to run RANSAC
+      ransac_mode: the mode of compute_RT_ransac to use (RANSAC only)
+      confidence: if provided, RANSAC stops adaptively once it has found an all-inlier sample
+        with this probability, running at least min_iter and at most num_iter iterations
+      min_iter: the minimum number of iterations to run adaptive RANSAC
+      warm_start_ratio: if provided, RANSAC reuses the previous pose when at least this fraction
+        of the points are still its inliers
+      return_pose: whether to also return the head pose used to compute the gaze point
 
     Returns:
       gaze_point: a 2 long vector containing the location on the screen the user is looking at,
         in the same units as camera matricess and measured relative to position of camera. uses same
         +x and +y axis as described in __init__.
+      R, T: the rotation and translation of the head from the calibration model (only if return_pose)
     """
     if use_ransac:
       if points_3d is None:
-        R, T, inliers = self.compute_RT_ransac(points=points, threshold=threshold, num_iter=num_iter)
+        R, T, inliers = self.compute_RT_ransac(points=points, threshold=threshold, num_iter=num_iter,
+                                               mode=ransac_mode, confidence=confidence, min_iter=min_iter,
+                                               warm_start_ratio=warm_start_ratio)
       else:
-        R, T, inliers = self.compute_RT_ransac(points_3d=points_3d, threshold=threshold, num_iter=num_iter)
+        R, T, inliers = self.compute_RT_ransac(points_3d=points_3d, threshold=threshold, num_iter=num_iter,
+                                               mode=ransac_mode, confidence=confidence, min_iter=min_iter,
+                                               warm_start_ratio=warm_start_ratio)
     else:
       if points_3d is None:
         R, T = self.compute_RT(points)
@@ -284,6 +608,8 @@ class StereoModelCalibration:
       raise NoIntersectionException("Gaze direction does not intersect with screen plane.")
     intersection = new_centroid + gaze_dir * theta
     gaze_point = intersection[0:2] - self._initial_pos
+    if return_pose:
+      return gaze_point, R, T
     return gaze_point
 
 def test_run():
@@ -0,0 +1,226 @@
+#!/usr/bin/env python2
+"""Synthetic stereo facial landmarks from scripted head trajectories.
+
+Landmarks are generated by moving a 68-point face model along a trajectory and projecting it
+through the calibrated stereo camera matrices, with optional noise, outliers and dropouts.
+When run as a program, this module stands in for gazr_estimate_facial_landmarks, writing one
+camera's landmarks to stdout in the same text or --binary format, or into a --shm ring.
+"""
+import os
+import sys
+import time
+import argparse
+import collections
+
+import numpy as np
+
+import stereo_util
+import tracker_output
+
+NUM_KEYPOINTS = 68
+
+def _make_face_model():
+    """Returns a 68 x 3 face model in cm in the dlib landmark order, centered near the nose.
+    +x is to the right of the image, +y is down and +z is away from the cameras."""
+    jaw_angles = np.linspace(-0.47 * np.pi, 0.47 * np.pi, 17)
+    jaw = np.stack([7.0 * np.sin(jaw_angles), 6.5 * np.cos(jaw_angles) - 0.5,
+                    4.0 * np.sin(jaw_angles) ** 2 + 0.5], axis=1)
+    brow_x = np.linspace(-5.5, -1.5, 5)
+    right_brow = np.stack([brow_x, -3.5 - 0.5 * np.sin(np.linspace(0, np.pi, 5)), np.full(5, 0.6)], axis=1)
+    left_brow = right_brow[::-1] * [-1, 1, 1]
+    nose_bridge = np.stack([np.zeros(4), np.linspace(-2.5, 0.5, 4), np.linspace(0.3, -2.0, 4)], axis=1)
+    nose_x = np.linspace(-1.5, 1.5, 5)
+    nose_bottom = np.stack([nose_x, np.full(5, 1.5), -1.0 + 0.4 * np.abs(nose_x)], axis=1)
+
+    def ellipse(center, radii, num_points, depth):
+        angles = np.pi + np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+        return np.stack([center[0] + radii[0] * np.cos(angles), center[1] + radii[1] * np.sin(angles),
+                         np.full(num_points, depth)], axis=1)
+    right_eye = ellipse((-3.0, -1.8), (1.3, 0.5), 6, 0.5)
+    left_eye = ellipse((3.0, -1.8), (1.3, 0.5), 6, 0.5)
+    outer_mouth = ellipse((0.0, 3.8), (2.5, 1.0), 12, -0.3)
+    inner_mouth = ellipse((0.0, 3.8), (1.6, 0.4), 8, -0.2)
+    return np.concatenate([jaw, right_brow, left_brow, nose_bridge, nose_bottom, right_eye, left_eye,
+                           outer_mouth, inner_mouth])
+
+FACE_MODEL = _make_face_model()
+
+def euler_to_rotation(yaw, pitch, roll):
+    """Returns the rotation matrix for angles in degrees about the y, x and z axes respectively."""
+    (yaw, pitch, roll) = np.deg2rad([yaw, pitch, roll])
+    R_yaw = np.array([[np.cos(yaw), 0, np.sin(yaw)], [0, 1, 0], [-np.sin(yaw), 0, np.cos(yaw)]])
+    R_pitch = np.array([[1, 0, 0], [0, np.cos(pitch), -np.sin(pitch)], [0, np.sin(pitch), np.cos(pitch)]])
+    R_roll = np.array([[np.cos(roll), -np.sin(roll), 0], [np.sin(roll), np.cos(roll), 0], [0, 0, 1]])
+    return R_yaw.dot(R_pitch).dot(R_roll)
+
+class HeadTrajectory(object):
+    """A head trajectory in which each of x, y, z, yaw, pitch and roll oscillates sinusoidally."""
+    DEGREES_OF_FREEDOM = ('x', 'y', 'z', 'yaw', 'pitch', 'roll')
+
+    def __init__(self, center=(11.9, 0.0, 60.0, 0.0, 0.0, 0.0), amplitudes=(0, 0, 0, 0, 0, 0),
+                 periods=(4, 4, 4, 4, 4, 4), phases=(0, 0, 0, 0, 0, 0)):
+        """
+        Arguments:
+            center: the mean x, y, z (cm, in the left camera's frame) and yaw, pitch, roll (deg)
+            amplitudes: the amplitudes of the oscillations of each degree of freedom
+            periods: the periods of the oscillations, in seconds
+            phases: the phases of the oscillations, in radians
+        """
+        self.center = np.asarray(center, dtype=float)
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        self.periods = np.asarray(periods, dtype=float)
+        self.phases = np.asarray(phases, dtype=float)
+
+    def get_parameters(self, t):
+        """Returns x, y, z, yaw, pitch and roll at time t, in seconds."""
+        return self.center + self.amplitudes * np.sin(2 * np.pi * t / self.periods + self.phases)
+
+    def get_pose(self, t):
+        """Returns the rotation and translation of the face model at time t."""
+        parameters = self.get_parameters(t)
+        return (euler_to_rotation(*parameters[3:]), parameters[:3])
+
+TRAJECTORIES = {
+    'still': HeadTrajectory(),
+    'shake': HeadTrajectory(amplitudes=(0, 0, 0, 20, 0, 0), periods=(4, 4, 4, 2, 4, 4)),
+    'nod': HeadTrajectory(amplitudes=(0, 0, 0, 0, 15, 0), periods=(4, 4, 4, 4, 2, 4)),
+    'sway': HeadTrajectory(amplitudes=(8, 2, 5, 10, 5, 3), periods=(4, 5, 6, 3, 3.5, 5)),
+    'wander': HeadTrajectory(amplitudes=(12, 6, 10, 25, 15, 10), periods=(7, 5, 11, 4, 3, 6),
+                             phases=(0, 1, 2, 3, 4, 5)),
+}
+
+def project_points(points_3d, camera_matrices):
+    """Projects N x 3 points through C x 3 x 4 camera matrices into N x C x 2 image points."""
+    homogeneous = np.concatenate([points_3d, np.ones((len(points_3d), 1))], axis=1)
+    projected = np.einsum('cij,nj->nci', camera_matrices, homogeneous)
+    return projected[..., :2] / projected[..., 2:]
+
+def get_default_camera_matrices():
+    """Returns the camera matrices of the calibrated stereo rig."""
+    import stereo_cameras
+    return stereo_util.make_parallel_camera_matrices(
+        stereo_cameras.K_LEFT, stereo_cameras.K_RIGHT, -stereo_cameras.TRANSLATION[0])
+
+SyntheticFrame = collections.namedtuple('SyntheticFrame', [
+    'frame_id', 'timestamp', 'keypoints', 'detected', 'rotation', 'translation', 'points_3d'])
+
+class SyntheticStereoSource(object):
+    """Generates stereo facial landmarks with ground truth from a head trajectory.
+
+    Frames are rendered deterministically from the seed and the frame index, so separate
+    sources with the same options (e.g. one per camera, in separate processes) agree.
+    """
+    def __init__(self, trajectory='sway', frame_rate=30.0, noise=0.5, outlier_rate=0.0, outlier_scale=40.0,
+                 dropout_rate=0.0, seed=0, camera_matrices=None, model=FACE_MODEL):
+        """
+        Arguments:
+            trajectory: a HeadTrajectory, or the name of one of TRAJECTORIES
+            frame_rate: the number of frames per second of trajectory time
+            noise: the standard deviation of Gaussian noise added to landmarks, in px
+            outlier_rate: the probability that each landmark is displaced as an outlier
+            outlier_scale: the standard deviation of outlier displacements, in px
+            dropout_rate: the probability that each camera fails to detect the face in a frame
+            camera_matrices: C x 3 x 4 camera matrices; defaults to the calibrated stereo rig
+            model: the N x 3 face model
+        """
+        self.trajectory = TRAJECTORIES[trajectory] if isinstance(trajectory, str) else trajectory
+        self.frame_rate = frame_rate
+        self.noise = noise
+        self.outlier_rate = outlier_rate
+        self.outlier_scale = outlier_scale
+        self.dropout_rate = dropout_rate
+        self.seed = seed
+        self.camera_matrices = get_default_camera_matrices() if camera_matrices is None else camera_matrices
+        self.model = model
+
+    def render(self, frame_index):
+        """Renders the frame captured at time frame_index / frame_rate."""
+        timestamp = frame_index / float(self.frame_rate)
+        (rotation, translation) = self.trajectory.get_pose(timestamp)
+        points_3d = self.model.dot(rotation.T) + translation
+        keypoints = project_points(points_3d, self.camera_matrices)
+
+        random = np.random.RandomState([self.seed, frame_index % (2 ** 32)])
+        keypoints += random.randn(*keypoints.shape) * self.noise
+        outliers = random.rand(*keypoints.shape[:2]) < self.outlier_rate
+        keypoints[outliers] += random.randn(np.count_nonzero(outliers), 2) * self.outlier_scale
+        detected = random.rand(keypoints.shape[1]) >= self.dropout_rate
+        return SyntheticFrame(frame_index, timestamp, keypoints, detected, rotation, translation, points_3d)
+
+    def generate(self, num_frames, start_index=0):
+        """Yields num_frames consecutive frames."""
+        for frame_index in range(start_index, start_index + num_frames):
+            yield self.render(frame_index)
+
+def format_landmarks_line(frame, camera_index):
+    """Formats one camera's landmarks like gazr_estimate_facial_landmarks does."""
+    if not frame.detected[camera_index]:
+        return '{}\n'
+    landmarks = frame.keypoints[:, camera_index]
+    return ('{"face_0": [' + ', '.join('[{:.4f}, {:.4f}]'.format(x, y) for (x, y) in landmarks)
+            + '],}\n')
+
+def get_tracker_args(**options):
+    """Returns a command line which runs this module as a stand-in tracker, for the tracker_args
+    of facial_landmarks.FacialLandmarks. Options are the long options of this program."""
+    args = [sys.executable, os.path.abspath(__file__).replace('.pyc', '.py')]
+    for (option, value) in sorted(options.items()):
+        args.append('--' + option.replace('_', '-'))
+        if value is not True:
+            args.append(str(value))
+    return args
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Stand-in for gazr_estimate_facial_landmarks which '
+                                                 'emits synthetic landmarks.')
+    parser.add_argument('--camera', type=int, default=0, help='index of the camera to emit')
+    parser.add_argument('--binary', action='store_true', help='write frames in the packed binary format')
+    parser.add_argument('--shm', help='write binary frames into a shared-memory ring at this path')
+    parser.add_argument('--show', action='store_true', help='ignored, for compatibility with gazr')
+    parser.add_argument('--model', help='ignored, for compatibility with gazr')
+    parser.add_argument('--trajectory', default='sway', choices=sorted(TRAJECTORIES))
+    parser.add_argument('--rate', type=float, default=30.0, help='frames per second')
+    parser.add_argument('--noise', type=float, default=0.5, help='landmark noise, in px')
+    parser.add_argument('--outlier-rate', type=float, default=0.0)
+    parser.add_argument('--dropout-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=0, help='number of frames to emit, or 0 to run forever')
+    parser.add_argument('--unpaced', action='store_true',
+                        help='emit frames as fast as possible instead of in real time')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    source = SyntheticStereoSource(args.trajectory, args.rate, args.noise, args.outlier_rate,
+                                   dropout_rate=args.dropout_rate, seed=args.seed)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    writer = None
+    if args.shm is not None:
+        import shared_frames
+        writer = shared_frames.SharedFrameWriter(args.shm, capacity=2 * NUM_KEYPOINTS)
+
+    # Frames lie on a grid of absolute times, so that trackers for each camera emit matching frames
+    frame_index = int(np.ceil(time.time() * args.rate))
+    num_emitted = 0
+    while not args.frames or num_emitted < args.frames:
+        frame = source.render(frame_index)
+        if not args.unpaced:
+            delay = frame.timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        if frame.detected[args.camera]:
+            faces = frame.keypoints[:, args.camera].reshape(1, -1)
+        else:
+            faces = np.zeros((0, 0))
+        if writer is not None:
+            writer.write(frame.frame_id, frame.timestamp, faces)
+        elif args.binary:
+            stdout.write(tracker_output.pack_frame(frame.frame_id, frame.timestamp, faces))
+        else:
+            stdout.write(format_landmarks_line(frame, args.camera))
+        stdout.flush()
+        frame_index += 1
+        num_emitted += 1
+
+if __name__ == '__main__':
+    main()
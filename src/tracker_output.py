@@ -0,0 +1,183 @@
+"""Parsers for the output streams of the gazr trackers."""
+import re
+import string
+import struct
+import collections
+
+import numpy as np
+
+try:
+    _LANDMARK_DELIMITERS = string.maketrans('[]{},', '     ')
+except AttributeError:
+    _LANDMARK_DELIMITERS = str.maketrans('[]{},', '     ')
+_POSE_FIELD = re.compile(r'"(\w+)":\s*([^,}\s]+)')
+
+def _split_faces(line):
+    """Yields (face name, remainder of the face's entry) for each face in a tracker output line."""
+    for entry in line.split('"face_')[1:]:
+        (face_index, remainder) = entry.split('"', 1)
+        yield ('face_' + face_index, remainder)
+
+def parse_landmarks_line(line):
+    """Parses a line from gazr_estimate_facial_landmarks, of the form
+    {"face_0": [[x, y], [x, y], ...],"face_1": [...],}
+
+    Returns:
+        A dict from face names to N x 2 float32 arrays of the facial landmarks. The arrays are
+        newly allocated, so they may be kept by the caller.
+    """
+    faces = {}
+    for (face, remainder) in _split_faces(line):
+        text = remainder[remainder.index(':') + 1:].translate(_LANDMARK_DELIMITERS)
+        if text.isspace():  # np.fromstring does not return an empty array for blank text
+            faces[face] = np.empty((0, 2), dtype=np.float32)
+            continue
+        values = np.fromstring(text, dtype=np.float32, sep=' ')
+        if values.size % 2:
+            raise ValueError('Malformed facial landmarks for {}: {}'.format(face, line))
+        faces[face] = values.reshape(-1, 2)
+    return faces
+
+def parse_pose_line(line):
+    """Parses a line from gazr_estimate_head_direction, of the form
+    {"face_0":{"yaw":0.0, "pitch":0.0, "roll":0.0,"x":0.0, "y":0.0, "z":0.0},}
+
+    Returns:
+        A dict from face names to dicts of the head pose parameters.
+    """
+    return {face: {key: float(value) for (key, value) in _POSE_FIELD.findall(remainder)}
+            for (face, remainder) in _split_faces(line)}
+
+# Binary frame format written by the gazr tools with --binary (see ext/gazr/tools/binary_output.hpp)
+
+FRAME_MAGIC = b'GZRF'
+FRAME_HEADER = struct.Struct('<4sIIIQd')  # magic, num_faces, values_per_face, reserved, frame_id, timestamp
+POSE_VALUES = ('yaw', 'pitch', 'roll', 'x', 'y', 'z')
+
+Frame = collections.namedtuple('Frame', ['frame_id', 'timestamp', 'faces'])
+
+def pack_frame(frame_id, timestamp, faces):
+    """Encodes a frame in the binary format.
+
+    Arguments:
+        faces: a num_faces x values_per_face array of values, or a sequence of per-face arrays.
+    """
+    faces = np.asarray(faces, dtype='<f4')
+    faces = faces.reshape(len(faces), -1) if len(faces) else faces.reshape(0, 0)
+    return (FRAME_HEADER.pack(FRAME_MAGIC, faces.shape[0], faces.shape[1], 0, frame_id, timestamp)
+            + faces.tobytes())
+
+class FrameReader(object):
+    """Reads binary frames from a stream into reusable buffers."""
+    def __init__(self, stream):
+        self.stream = stream
+        self._header_buffer = bytearray(FRAME_HEADER.size)
+        self._payload_buffer = bytearray()
+
+    def _read_into(self, buffer):
+        """Fills buffer from the stream. Returns False if the stream ended first."""
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(buffer):
+            num_read = self.stream.readinto(view[filled:])
+            if not num_read:
+                return False
+            filled += num_read
+        return True
+
+    def read(self):
+        """Reads the next frame from the stream.
+
+        Returns:
+            A Frame whose faces are a num_faces x values_per_face float32 view into a buffer
+            which is reused by the next read, or None if the stream has ended.
+        """
+        if not self._read_into(self._header_buffer):
+            return None
+        (magic, num_faces, values_per_face, _, frame_id, timestamp) = FRAME_HEADER.unpack_from(
+            self._header_buffer)
+        if magic != FRAME_MAGIC:
+            raise ValueError('Lost synchronization with the binary frame stream')
+        payload_size = num_faces * values_per_face * 4
+        if len(self._payload_buffer) < payload_size:
+            self._payload_buffer = bytearray(payload_size)
+        payload = memoryview(self._payload_buffer)[:payload_size]
+        if not self._read_into(payload):
+            return None
+        faces = np.frombuffer(self._payload_buffer, dtype='<f4', count=num_faces * values_per_face)
+        return Frame(frame_id, timestamp, faces.reshape(num_faces, values_per_face))
+
+    def __iter__(self):
+        return iter(self.read, None)
+
+def unpack_frames(buffer):
+    """Decodes the complete frames at the start of a buffer of bytes from a binary stream.
+
+    Returns:
+        A list of Frames, each with its own copy of the values, and the number of bytes of the
+        buffer which they took up.
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        (magic, num_faces, values_per_face, _, frame_id, timestamp) = FRAME_HEADER.unpack_from(
+            buffer, offset)
+        if magic != FRAME_MAGIC:
+            raise ValueError('Lost synchronization with the binary frame stream')
+        end = offset + FRAME_HEADER.size + 4 * num_faces * values_per_face
+        if end > len(buffer):
+            break
+        faces = np.frombuffer(bytes(buffer[offset + FRAME_HEADER.size:end]), dtype='<f4')
+        frames.append(Frame(frame_id, timestamp, faces.reshape(num_faces, values_per_face)))
+        offset = end
+    return (frames, offset)
+
+def landmarks_from_frame(frame):
+    """Converts a binary landmarks frame into the dict returned by parse_landmarks_line."""
+    return {'face_{}'.format(index): face.reshape(-1, 2) for (index, face) in enumerate(frame.faces)}
+
+def pose_from_frame(frame):
+    """Converts a binary head pose frame into the dict returned by parse_pose_line."""
+    return {'face_{}'.format(index): dict(zip(POSE_VALUES, face.tolist()))
+            for (index, face) in enumerate(frame.faces)}
+
+def landmarks_to_faces(data):
+    """Converts a dict returned by parse_landmarks_line into a num_faces x values_per_face array."""
+    return np.array([np.ravel(data['face_{}'.format(index)]) for index in range(len(data))],
+                    dtype=np.float32)
+
+def pose_to_faces(data):
+    """Converts a dict returned by parse_pose_line into a num_faces x len(POSE_VALUES) array."""
+    return np.array([[data['face_{}'.format(index)][value] for value in POSE_VALUES]
+                     for index in range(len(data))], dtype=np.float32)
+
+def _benchmark(num_trials=2000):
+    """Compares the parsers against eval on representative tracker output lines."""
+    import io
+    import timeit
+    landmarks = np.random.uniform(0, 320, (68, 2))
+    landmarks_line = ('{"face_0": [' + ', '.join('[{:.4f}, {:.4f}]'.format(x, y) for (x, y) in landmarks)
+                      + '],}\n')
+    pose_line = ('{"face_0":{"yaw":181.2, "pitch":178.9, "roll":-88.4,'
+                 '"x":0.0123, "y":-0.0456, "z":0.5678},}\n')
+    assert np.allclose(parse_landmarks_line(landmarks_line)['face_0'],
+                       np.array(eval(landmarks_line)['face_0']), atol=1e-3)
+    assert parse_pose_line(pose_line) == eval(pose_line)
+    landmarks_stream = io.BytesIO(pack_frame(0, 0.0, [landmarks]) * num_trials)
+    landmarks_reader = FrameReader(landmarks_stream)
+    assert np.allclose(landmarks_from_frame(landmarks_reader.read())['face_0'], landmarks)
+    landmarks_stream.seek(0)
+    eval_times = {}
+    for (name, line, parse) in (('landmarks', landmarks_line, parse_landmarks_line),
+                                ('pose', pose_line, parse_pose_line)):
+        eval_time = eval_times[name] = timeit.timeit(lambda: eval(line), number=num_trials) / num_trials
+        parse_time = timeit.timeit(lambda: parse(line), number=num_trials) / num_trials
+        print '{}: eval {:.1f} us, parser {:.1f} us, speedup {:.1f}x'.format(
+            name, eval_time * 1e6, parse_time * 1e6, eval_time / parse_time)
+    read_time = timeit.timeit(lambda: landmarks_from_frame(landmarks_reader.read()),
+                              number=num_trials) / num_trials
+    print 'landmarks: binary frame reader {:.1f} us, speedup {:.1f}x over eval'.format(
+        read_time * 1e6, eval_times['landmarks'] / read_time)
+
+if __name__ == '__main__':
+    _benchmark()
@@ -2,26 +2,41 @@
 """Generic utility functions."""
 import numpy as np
 
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
 class RingBuffer(object):
-    """A 1-D ring buffer."""
-    def __init__(self, length, dtype='f'):
+    """A ring buffer of scalars, or of arrays of a fixed shape along the first axis.
+
+    The buffer is mirrored: every value is written twice into storage of double length, so
+    that the values in time order are always a contiguous slice of the storage. data is the
+    first half of the storage.
+    """
+    def __init__(self, length, dtype='f', shape=()):
         if length == 0:
             raise ValueError('RingBuffer length must be a positive number!')
-        self.data = np.zeros(length, dtype=dtype)
+        self._mirrored = np.zeros((2 * length,) + tuple(shape), dtype=dtype)
+        self.data = self._mirrored[:length]
+        # Read-only time-ordered views for each fill level and each position of the oldest value
+        self._partial_views = [_read_only(self._mirrored[:filled]) for filled in range(length + 1)]
+        self._full_views = [_read_only(self._mirrored[start:start + length])
+                            for start in range(length)]
         self._index = -1
         self.length = 0
 
     def reset(self):
-        self.data = np.zeros(self.data.shape[0], dtype=self.data.dtype)
+        self._mirrored.fill(0)
         self._index = -1
         self.length = 0
 
     def append(self, value):
         """Adds a value to the buffer, overwriting a stale entry if needed."""
-        if self.length < self.data.size:
+        if self.length < self.data.shape[0]:
             self.length += 1
-        self._index = (self._index + 1) % self.data.size
-        self.data[self._index] = value
+        self._index = (self._index + 1) % self.data.shape[0]
+        self._mirrored[self._index] = value
+        self._mirrored[self._index + self.data.shape[0]] = value
 
     def get_head(self):
         """Gets the most recently added value in the buffer."""
@@ -35,10 +50,85 @@ class RingBuffer(object):
             return None
 
     def get_continuous(self):
-        """Returns a copy of the buffer with elements in correct time order."""
-        if self.length < self.data.size:
-            return np.concatenate((self.data[:self._index + 1],
-                                   self.data[self._index + 1:]))[:self.length]
+        """Returns a read-only view of the buffer with elements in correct time order.
+        The view is not copied, so it changes as values are appended."""
+        if self.length < self.data.shape[0]:
+            return self._partial_views[self.length]
         else:
-            return np.concatenate((self.data[self._index + 1:],
-                                   self.data[:self._index + 1]))
+            return self._full_views[(self._index + 1) % self.data.shape[0]]
+
+class TimestampedRingBuffer(RingBuffer):
+    """A ring buffer of timestamped records, such as frames of facial landmarks.
+
+    Each record has a 'timestamp' field with the capture time and a 'values' field holding an
+    array of the given shape. Timestamps must be appended in nondecreasing order, so that
+    records can be looked up by time with binary search. All reads return views.
+    """
+    def __init__(self, length, shape=(), dtype='f'):
+        record_dtype = np.dtype([('timestamp', np.float64), ('values', dtype, tuple(shape))])
+        super(TimestampedRingBuffer, self).__init__(length, dtype=record_dtype)
+
+    def append(self, values, timestamp):
+        """Adds a record with the given values and capture timestamp."""
+        window_size = self.data.shape[0]
+        if self.length < window_size:
+            self.length += 1
+        self._index = (self._index + 1) % window_size
+        for index in (self._index, self._index + window_size):
+            self._mirrored['timestamp'][index] = timestamp
+            self._mirrored['values'][index] = values
+
+    def extend(self, values, timestamps):
+        """Adds several records at once.
+
+        Arguments:
+            values: an array of the values of K records, with the record shape after the first axis
+            timestamps: a length K array of the capture timestamps of the records
+        """
+        window_size = self.data.shape[0]
+        values = np.asarray(values)[-window_size:]
+        timestamps = np.asarray(timestamps)[-window_size:]
+        num_records = timestamps.shape[0]
+        if not num_records:
+            return
+        indices = (self._index + 1 + np.arange(num_records)) % window_size
+        for offset in (0, window_size):
+            self._mirrored['timestamp'][indices + offset] = timestamps
+            self._mirrored['values'][indices + offset] = values
+        self._index = indices[-1]
+        self.length = min(self.length + num_records, window_size)
+
+    def get_window(self, num_records=None):
+        """Returns a view of the newest num_records records (all records if None) in time order."""
+        records = self.get_continuous()
+        if num_records is None:
+            return records
+        return records[max(len(records) - num_records, 0):]
+
+    def get_timestamps(self):
+        """Returns a view of the timestamps of all records in time order."""
+        return self.get_continuous()['timestamp']
+
+    def get_values(self):
+        """Returns a view of the values of all records in time order."""
+        return self.get_continuous()['values']
+
+    def get_range(self, start_time, end_time):
+        """Returns a view of the records with timestamps between start_time and end_time, inclusive."""
+        records = self.get_continuous()
+        timestamps = records['timestamp']
+        start = np.searchsorted(timestamps, start_time, side='left')
+        end = np.searchsorted(timestamps, end_time, side='right')
+        return records[start:end]
+
+    def get_nearest(self, timestamp):
+        """Returns the record with the timestamp nearest to timestamp, or None if there are none."""
+        if not self.length:
+            return None
+        records = self.get_continuous()
+        timestamps = records['timestamp']
+        index = np.searchsorted(timestamps, timestamp)
+        if index == len(records) or (index > 0 and
+                                     timestamp - timestamps[index - 1] <= timestamps[index] - timestamp):
+            index -= 1
+        return records[index]